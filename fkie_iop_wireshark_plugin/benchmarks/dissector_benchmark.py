@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import argparse
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+
+try:
+  import lupa.lua52 as lupa
+except ImportError:
+  lupa = None
+
+'''
+Measures the dissection time of generated Lua plugins without Wireshark. The plugins run in Lua 5.2
+(https://pypi.org/project/lupa) with a minimal mock of the Wireshark Lua API. The same random packets
+are dissected by each plugin, e.g. to compare the plugin of the current generator with an older version:
+
+  git worktree add /tmp/before <commit>
+  python3 /tmp/before/fkie_iop_wireshark_plugin/scripts/iop_create_dissector.py -i jsidl -o /tmp/before.lua
+  dissector_benchmark.py /tmp/before.lua --input_path jsidl --check
+
+With --check the dissection trees and expert infos of all plugins are compared, the exit code is 1 if
+they differ.
+'''
+
+# mock of the Wireshark Lua API used by the plugin, tree items are logged only with --check
+WIRESHARK_MOCK = r'''
+base = {HEX=1, DEC=2, STRING=3, LEDEC=4, NONE=5}
+ftypes = {UINT16=1}
+PI_UNDECODED=1; PI_WARN=2; PI_SEQUENCE=3; PI_NOTE=4; PI_MALFORMED=5; PI_ERROR=6; PI_CHAT=7
+tree_log = {}
+buffer_slices = 0
+function set_plugin_info(info) end
+ProtoField = setmetatable({}, {__index=function(t, k) return function(abbr, ...) return {abbr=abbr} end end})
+Pref = {uint=function(label, default) return {default=default} end, bool=function(label, default) return {default=default} end,
+        string=function(label, default) return {default=default} end}
+local function mkprefs()
+  return setmetatable({}, {__newindex=function(t, k, v) rawset(t, k, v.default) end})
+end
+protos = {}
+function Proto(name, desc)
+  local p = {name=name, desc=desc, prefs=mkprefs()}
+  protos[name] = p
+  return p
+end
+message_ids = {}
+DissectorTable = {
+  new=function(name)
+    local t = {d={}}
+    function t:add(k, v) self.d[k] = v; message_ids[#message_ids + 1] = k end
+    function t:get_dissector(k)
+      local p = self.d[k]
+      if p == nil then return nil end
+      return function(...) return p.dissector(...) end
+    end
+    return t
+  end,
+  get=function(name) local t = {}; function t:add() end; return t end,
+}
+local Range = {}
+Range.__index = Range
+function Range:le_uint() local v = 0; for i = self.len - 1, 0, -1 do v = v * 256 + self.src.bytes[self.off + i + 1] end; return v end
+function Range:uint() local v = 0; for i = 0, self.len - 1 do v = v * 256 + self.src.bytes[self.off + i + 1] end; return v end
+function Range:string() local t = {}; for i = 1, self.len do t[i] = string.char(self.src.bytes[self.off + i]) end; return table.concat(t) end
+function Range:tvb() local b = {}; for i = 1, self.len do b[i] = self.src.bytes[self.off + i] end; return mktvb(b) end
+function Range:len() return self.len end
+function mktvb(bytes)
+  local t = {bytes=bytes}
+  function t:len() return #self.bytes end
+  return setmetatable(t, {__call=function(self, off, len)
+    buffer_slices = buffer_slices + 1
+    off = off or 0
+    if len == nil then len = #self.bytes - off end
+    if off < 0 or len < 0 or off + len > #self.bytes then error("Range is out of bounds") end
+    return setmetatable({src=self, off=off, len=len}, Range)
+  end})
+end
+local Item = {}
+Item.__index = Item
+function mkitem(depth) return setmetatable({depth=depth}, Item) end
+local function logadd(self, ...)
+  if not logging then return self end
+  local parts = {}
+  for i, a in ipairs({...}) do
+    if type(a) == "table" and a.abbr then parts[#parts + 1] = a.abbr
+    elseif type(a) == "table" and a.off then parts[#parts + 1] = string.format("@%d:%d", a.off, a.len)
+    elseif type(a) == "table" and a.name then parts[#parts + 1] = a.name
+    else parts[#parts + 1] = tostring(a) end
+  end
+  tree_log[#tree_log + 1] = string.rep("  ", self.depth) .. table.concat(parts, " | ")
+  return mkitem(self.depth + 1)
+end
+Item.add = logadd
+Item.add_le = logadd
+function Item:append_text(t) if logging then tree_log[#tree_log + 1] = string.rep("  ", self.depth) .. "+" .. t end end
+function Item:add_expert_info(g, s, t) if logging then tree_log[#tree_log + 1] = string.rep("  ", self.depth) .. "!" .. tostring(t) end end
+function Item:add_proto_expert_info(e, t) if logging then tree_log[#tree_log + 1] = string.rep("  ", self.depth) .. "!" .. tostring(t or e.text) end end
+function Item:set_generated() return self end
+function Item:set_len() return self end
+function mkpinfo(number, visited)
+  local info = setmetatable({v=""}, {__tostring=function(s) return s.v end})
+  function info:set(v) self.v = v end
+  function info:append(v) self.v = self.v .. v end
+  return {number=number, abs_ts=0, visited=visited, cols={info=info}}
+end
+function dissect_all(packets, loops)
+  -- returns seconds, count of buffer slices per packet and count of packets failed with a Lua error,
+  -- e.g. plugins without length checks stop with "Range is out of bounds" at truncated packets
+  local pinfo = mkpinfo(1, true)
+  local root = mkitem(0)
+  local dissector = protos['IOP'].dissector
+  local errors = 0
+  buffer_slices = 0
+  local start = os.clock()
+  for loop = 1, loops do
+    for i = 1, #packets do
+      if not pcall(dissector, packets[i], pinfo, root) then errors = errors + 1 end
+    end
+  end
+  return os.clock() - start, buffer_slices / (#packets * loops), errors / loops
+end
+function dissect_logged(tvb, number)
+  tree_log = {}
+  logging = true
+  local pinfo = mkpinfo(number, false)
+  local ok, err = pcall(protos['IOP'].dissector, tvb, pinfo, mkitem(0))
+  logging = false
+  if not ok then tree_log[#tree_log + 1] = "error: " .. tostring(err) end
+  return pinfo.cols.info.v, table.concat(tree_log, "\n")
+end
+'''
+
+
+def load_plugin(lua_path):
+  runtime = lupa.LuaRuntime()
+  runtime.execute(WIRESHARK_MOCK)
+  with open(lua_path) as f:
+    runtime.execute(f.read())
+  return runtime
+
+
+def iop_packet(payload, seq_nr):
+  # IOP header with source 5.1.1 and destination 1.1.1 followed by the message and the sequence number
+  return struct.pack('<BBHBII', 2, 0, 16 + len(payload), 0, 0x10101, 0x50101) + payload + struct.pack('<H', seq_nr)
+
+
+def create_packets(message_ids, count, max_size, seed, min_size=0):
+  '''
+  Random packets for the message IDs, with a payload length between min_size and max_size bytes
+  to cover complete and truncated messages.
+  '''
+  rnd = random.Random(seed)
+  result = []
+  for idx in range(count):
+    message_id = message_ids[idx % len(message_ids)]
+    # 7-bit values keep the strings in the tree printable
+    payload = struct.pack('<H', message_id) + bytes(bytearray([rnd.getrandbits(7) for _ in range(rnd.randint(min_size, max_size))]))
+    result.append(iop_packet(payload, idx % 65536))
+  return result
+
+
+def generate_plugin(input_path, output_path):
+  script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts', 'iop_create_dissector.py')
+  subprocess.check_call([sys.executable, script, '--input_path', input_path, '--output_path', output_path], stdout=sys.stderr)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Benchmark of the dissection with generated Lua plugins')
+  parser.add_argument('lua', nargs='*', help='Generated Lua plugins')
+  parser.add_argument('-i', '--input_path', help='Generate a plugin from these JSIDL files with the current generator and add it to the benchmark')
+  parser.add_argument('-m', '--message', nargs='+', help='Message IDs, e.g. 0x4402, Default: all messages of the first plugin')
+  parser.add_argument('-p', '--packets', type=int, default=1000, help='Count of random packets, Default: 1000')
+  parser.add_argument('-s', '--size', type=int, default=128, help='Maximal payload length of the random packets, Default: 128')
+  parser.add_argument('--min_size', type=int, default=0, help='Minimal payload length of the random packets, Default: 0')
+  parser.add_argument('-l', '--loops', type=int, default=5, help='Dissections of all packets in each run, Default: 5')
+  parser.add_argument('-r', '--repeat', type=int, default=5, help='Runs of each plugin, the fastest is reported, Default: 5')
+  parser.add_argument('--seed', type=int, default=1, help='Seed of the random packets, Default: 1')
+  parser.add_argument('-c', '--check', action='store_true', help='Compare the dissection trees of all plugins')
+  args = parser.parse_args()
+  if lupa is None:
+    raise Exception("lupa not found, install it with 'pip install lupa'")
+  workdir = tempfile.mkdtemp(prefix='iop_dissector_benchmark_')
+  try:
+    plugins = list(args.lua)
+    if args.input_path:
+      plugins.append(os.path.join(workdir, 'fkie_iop.lua'))
+      generate_plugin(args.input_path, plugins[-1])
+    if not plugins:
+      parser.error('no plugin given, use lua files or --input_path')
+    runtimes = [load_plugin(path) for path in plugins]
+    if args.message:
+      message_ids = [int(value, 16) if value.lower().startswith('0x') else int(value) for value in args.message]
+    else:
+      message_ids = sorted(runtimes[0].globals().message_ids.values())
+    if not message_ids:
+      raise Exception("no message dissectors found in %s" % plugins[0])
+    packets = create_packets(message_ids, args.packets, args.size, args.seed, min(args.min_size, args.size))
+    print("%d packets of %d messages, payload %d..%d bytes" % (len(packets), len(message_ids), min(args.min_size, args.size), args.size))
+    for path, runtime in zip(plugins, runtimes):
+      tvbs = runtime.table_from([runtime.globals().mktvb(runtime.table_from(list(bytearray(packet)))) for packet in packets])
+      best = None
+      for _ in range(args.repeat):
+        seconds, slices, errors = runtime.globals().dissect_all(tvbs, args.loops)
+        best = seconds if best is None else min(best, seconds)
+      print("%s: %.1f us/packet, %.1f buffer slices/packet, %d packets with Lua errors" % (path, best / (len(packets) * args.loops) * 1e6, slices, errors))
+    if args.check and len(runtimes) > 1:
+      differences = 0
+      for number, packet in enumerate(packets, 1):
+        results = []
+        for runtime in runtimes:
+          results.append(tuple(runtime.globals().dissect_logged(runtime.globals().mktvb(runtime.table_from(list(bytearray(packet)))), number)))
+        if any(result != results[0] for result in results[1:]):
+          differences += 1
+      print("%d of %d packets dissected differently" % (differences, len(packets)))
+      if differences:
+        sys.exit(1)
+  finally:
+    shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import argparse
+import mmap
+import random
+import socket
+import struct
+import time
+
+from fkie_iop_wireshark_plugin.pcap_index import iop_header, pcap_frames, transport_payload
+
+'''
+Sends the IOP packets of a capture file as UDP datagrams, e.g. to test iop_live_monitor.py without robot:
+
+  iop_udp_replay.py capture.pcapng --speed 0 --loop 10 --drop 0.01
+
+With --speed 0 the packets are sent as fast as possible to check the monitor under overload. The sequence
+numbers are continued in each further loop, so only the dropped packets are reported as lost.
+'''
+
+
+def read_packets(pcap_path):
+  '''
+  :return: list of tuples (timestamp in seconds, IOP packet)
+  '''
+  result = []
+  with open(pcap_path, 'rb') as f:
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      for timestamp_ns, offset, caplen, linktype in pcap_frames(data):
+        try:
+          payload = transport_payload(data[offset:offset + caplen], linktype)
+          if payload is not None and iop_header(payload) is not None:
+            result.append((timestamp_ns / 1e9, payload))
+        except (IndexError, struct.error):
+          continue
+    finally:
+      data.close()
+  return result
+
+
+def sequence_spans(packets):
+  # count of sequence numbers used by each stream in one loop
+  first = {}
+  last = {}
+  for _timestamp, payload in packets:
+    _message_id, src, dst, seq_nr, _data_flags = iop_header(payload)
+    first.setdefault((src, dst), seq_nr)
+    last[(src, dst)] = seq_nr
+  return dict([(key, (last[key] - first[key]) % 65536 + 1) for key in first])
+
+
+def replay(packets, target, speed=1.0, loops=1, drop=0.0):
+  '''
+  :return: tuple (count of sent packets, seconds)
+  '''
+  sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  spans = sequence_spans(packets)
+  sent = 0
+  start = time.time()
+  for loop in range(loops):
+    loop_start = time.time()
+    for timestamp, payload in packets:
+      if drop and random.random() < drop:
+        continue
+      if speed > 0:
+        delay = loop_start + (timestamp - packets[0][0]) / speed - time.time()
+        if delay > 0.001:
+          time.sleep(delay)
+      if loop:
+        _message_id, src, dst, seq_nr, _data_flags = iop_header(payload)
+        payload = payload[:-2] + struct.pack('<H', (seq_nr + loop * spans[(src, dst)]) % 65536)
+      sock.sendto(payload, target)
+      sent += 1
+  sock.close()
+  return sent, time.time() - start
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Sends the IOP packets of a capture file as UDP datagrams')
+  parser.add_argument('pcap', help='Capture file, pcap or pcapng')
+  parser.add_argument('-a', '--address', default='127.0.0.1', help='Destination address, Default: 127.0.0.1')
+  parser.add_argument('-p', '--port', type=int, default=3794, help='Destination port, Default: 3794')
+  parser.add_argument('-s', '--speed', type=float, default=1.0, help='Factor of the capture timing, 0 sends as fast as possible, Default: 1')
+  parser.add_argument('-l', '--loop', type=int, default=1, help='Count of replays, Default: 1')
+  parser.add_argument('-d', '--drop', type=float, default=0.0, help='Ratio of packets not sent to test the loss statistics, Default: 0')
+  args = parser.parse_args()
+  packets = read_packets(args.pcap)
+  if not packets:
+    raise Exception("no IOP packets found in %s" % args.pcap)
+  try:
+    sent, duration = replay(packets, (args.address, args.port), args.speed, args.loop, args.drop)
+    print("%d packets sent in %.2f s, %.0f packets/s" % (sent, duration, sent / duration if duration else 0))
+  except KeyboardInterrupt:
+    pass
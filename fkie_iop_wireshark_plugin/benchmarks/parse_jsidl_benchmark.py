@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+'''
+Measures how Parse_JSIDL scales with the size of the JSIDL files. For each combination of the
+given parameters a synthetic set of JSIDL files is created and the Lua plugin is generated in a
+separate process, so the memory high-water mark of each run is not influenced by other runs.
+
+  parse_jsidl_benchmark.py --files 10 100 --messages 10 --depth 1 4 --output result.json
+  parse_jsidl_benchmark.py --files 10 100 --messages 10 --depth 1 4 --baseline result.json
+
+The results are written as JSON. With --baseline the exit code is 1 if the total time or the
+memory high-water mark of a run exceeds the same case in the baseline by more than --tolerance.
+'''
+
+# methods of Parse_JSIDL with call count and time in the results. The time of recursive calls is counted once,
+# times of different methods overlap, e.g. _resolve_type_ref includes the _get_doc calls of referenced files
+PROFILED_METHODS = ['_index_xml_files', 'parse_jsidl_file', '_get_doc', '_resolve_type_ref', '_to_int', '_to_float',
+                    '_eval_const_expr', '_element_size', 'write_lua', 'write_catalog']
+
+CONST_SET = '''<?xml version="1.0" encoding="UTF-8"?>
+<declared_const_set xmlns="urn:jaus:jsidl:1.1" name="BenchConsts" id="urn:bench:consts" version="1.0">
+  <const_def name="LEN" const_type="unsigned integer" const_value="8" field_units="one"/>
+  <const_def name="LIMIT" const_type="long float" const_value="100.5" field_units="one"/>
+</declared_const_set>
+'''
+
+TYPE_SET_HEAD = '''<?xml version="1.0" encoding="UTF-8"?>
+<declared_type_set xmlns="urn:jaus:jsidl:1.1" name="BenchSet%(idx)d" id="urn:bench:set%(idx)d" version="1.0">
+  <declared_const_set_ref name="c" id="urn:bench:consts" version="1.0"/>
+  <declared_type_set_ref name="p" id="urn:bench:set%(prev)d" version="1.0"/>
+%(cross_refs)s  <fixed_field name="Value" field_type="unsigned short integer" field_units="one" optional="false">
+    <scale_range real_lower_limit="-c.LIMIT" real_upper_limit="c.LIMIT * 2" integer_function="round"/>
+  </fixed_field>
+  <bit_field name="Flags" field_type_unsigned="unsigned byte" optional="false">
+    <sub_field name="A"><bit_range from_index="0" to_index="1"/><value_set offset_to_lower_limit="false"><value_enum enum_index="0" enum_const="off"/></value_set></sub_field>
+  </bit_field>
+  <record name="Item" optional="false">
+    <fixed_field name="V" field_type="unsigned byte" field_units="one" optional="false"/>
+    <fixed_length_string name="S" string_length="c.LEN" optional="false"/>
+  </record>
+'''
+
+MESSAGE_DEF = '''  <message_def name="Msg%(idx)d_%(msg)d" message_id="%(msg_id)04X" is_command="false">
+    <description>synthetic message</description>
+    <header name="AppHeader"><record name="HeaderRec" optional="false">
+      <fixed_field name="MessageID" optional="false" field_type="unsigned short integer" field_units="one"/>
+    </record></header>
+    <body name="Body"><sequence name="Seq" optional="false">
+      <record name="Rec" optional="false">
+        <presence_vector field_type_unsigned="unsigned byte"/>
+        <fixed_field name="A" field_type="integer" field_units="one" optional="false"/>
+        <declared_fixed_field name="Deep" declared_type_ref="%(deep_ref)s" optional="false"/>
+%(cross_fields)s        <declared_bit_field name="F" declared_type_ref="Flags" optional="true"/>
+        <fixed_length_string name="L" string_length="c.LEN" optional="false"/>
+        <array name="Arr" optional="false">
+          <fixed_field name="E" field_type="unsigned short integer" field_units="one" optional="false"/>
+          <dimension name="d" size="c.LEN"/>
+        </array>
+      </record>
+      <list name="Items" optional="false">
+        <count_field field_type_unsigned="unsigned byte"/>
+        <declared_record name="It" declared_type_ref="p.Item" optional="false"/>
+      </list>
+    </sequence></body>
+    <footer name="Footer"/>
+  </message_def>
+'''
+
+FIRST_MESSAGE_ID = 0x1000
+
+
+def create_jsidl_files(path, files, messages, depth, cross_refs):
+  '''
+  Creates `files` type sets with `messages` messages each and a const set in `path`. Each set references
+  the previous one, a message field refers to a type `depth` references away, e.g. 'p.p.Value' for depth 2.
+  Additionally each message has a field for each of `cross_refs` references to other sets.
+  '''
+  if files * messages > 0x10000 - FIRST_MESSAGE_ID:
+    raise Exception("too many messages: %d, message IDs exceed 0xFFFF" % (files * messages))
+  with open(os.path.join(path, 'consts.xml'), 'w') as f:
+    f.write(CONST_SET)
+  deep_ref = '.'.join(['p'] * depth + ['Value'])
+  for idx in range(files):
+    cross = ''.join(['  <declared_type_set_ref name="x%d" id="urn:bench:set%d" version="1.0"/>\n' % (ref, (idx + ref + 1) % files) for ref in range(cross_refs)])
+    cross_fields = ''.join(['        <declared_fixed_field name="X%d" declared_type_ref="x%d.Value" optional="false"/>\n' % (ref, ref) for ref in range(cross_refs)])
+    # use subdirectories to avoid huge directories with large counts of files
+    set_path = os.path.join(path, 'set%03d' % (idx // 100))
+    if not os.path.isdir(set_path):
+      os.makedirs(set_path)
+    with open(os.path.join(set_path, 'set%d.xml' % idx), 'w') as f:
+      f.write(TYPE_SET_HEAD % {'idx': idx, 'prev': (idx - 1) % files, 'cross_refs': cross})
+      for msg in range(messages):
+        f.write(MESSAGE_DEF % {'idx': idx, 'msg': msg, 'msg_id': FIRST_MESSAGE_ID + idx * messages + msg, 'deep_ref': deep_ref, 'cross_fields': cross_fields})
+      f.write('</declared_type_set>\n')
+
+
+def max_rss():
+  # memory high-water mark of this process in KiB, None if not available on this platform
+  try:
+    import resource
+  except ImportError:
+    return None
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    # bytes on macOS
+    rss = rss // 1024
+  return rss
+
+
+def profile_methods(cls, methods, stats):
+  '''
+  Replaces the methods of `cls` by wrappers adding call count and time to `stats`.
+  The time of recursive calls is counted only once.
+  '''
+  def wrap(name, method):
+    entry = stats.setdefault(name, {'calls': 0, 'seconds': 0.0})
+    active = [0]
+
+    def wrapper(*args, **kwargs):
+      entry['calls'] += 1
+      if active[0]:
+        return method(*args, **kwargs)
+      active[0] += 1
+      start = time.perf_counter()
+      try:
+        return method(*args, **kwargs)
+      finally:
+        entry['seconds'] += time.perf_counter() - start
+        active[0] -= 1
+    return wrapper
+  for name in methods:
+    if hasattr(cls, name):
+      setattr(cls, name, wrap(name, getattr(cls, name)))
+
+
+def run_case(case):
+  '''
+  Creates the JSIDL files for `case` and generates the Lua plugin. Runs in its own process.
+  :return: dictionary with the results
+  '''
+  import logging
+  from fkie_iop_wireshark_plugin.parse_jsidl import Parse_JSIDL
+  logging.getLogger().setLevel(logging.WARNING)
+  workdir = tempfile.mkdtemp(prefix='iop_benchmark_')
+  try:
+    input_path = os.path.join(workdir, 'jsidl')
+    os.makedirs(input_path)
+    create_jsidl_files(input_path, case['files'], case['messages'], case['depth'], case['cross_refs'])
+    output_path = os.path.join(workdir, 'fkie_iop.lua')
+    catalog_path = os.path.join(workdir, 'messages.db') if case['catalog'] else None
+    stats = {}
+    profile_methods(Parse_JSIDL, PROFILED_METHODS, stats)
+    # count parsed documents, the cache hits are returned by _get_doc without parsing
+    doc_parsed = [0]
+    if case['tracemalloc']:
+      import tracemalloc
+      tracemalloc.start()
+    rss_before = max_rss()
+    start = time.perf_counter()
+    generator = _count_parsed_documents(Parse_JSIDL, doc_parsed, input_path, output_path, catalog_path)
+    total = time.perf_counter() - start
+    result = dict(case)
+    result['seconds'] = total
+    result['message_count'] = generator._message_count
+    result['failed_messages'] = len(generator._message_failed)
+    result['documents_parsed'] = doc_parsed[0]
+    result['doc_cache_size'] = Parse_JSIDL.DOC_CACHE_SIZE
+    result['lua_bytes'] = os.path.getsize(output_path)
+    result['methods'] = stats
+    result['memory'] = {'max_rss_kib': max_rss(), 'max_rss_before_kib': rss_before, 'tracemalloc_peak_bytes': None}
+    if case['tracemalloc']:
+      result['memory']['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+    return result
+  finally:
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _count_parsed_documents(cls, counter, input_path, output_path, catalog_path):
+  # _get_doc parses a document if it is not in the cache
+  get_doc = cls._get_doc
+
+  def _get_doc(self, path):
+    if path not in self.doc_files:
+      counter[0] += 1
+    return get_doc(self, path)
+  cls._get_doc = _get_doc
+  return cls(input_path, output_path, [], catalog_path)
+
+
+def run_case_in_process(case):
+  cmd = [sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case)]
+  proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+  stdout, _ = proc.communicate()
+  if proc.returncode != 0:
+    raise Exception("benchmark case failed: %s" % json.dumps(case))
+  return json.loads(stdout.decode('utf-8'))
+
+
+def case_key(result):
+  # runs with tracemalloc are slower and are compared only with runs using it too
+  return tuple([result[key] for key in ('files', 'messages', 'depth', 'cross_refs', 'catalog')] + [result.get('tracemalloc', False)])
+
+
+def case_str(result):
+  return "files=%(files)d messages=%(messages)d depth=%(depth)d cross_refs=%(cross_refs)d" % result
+
+
+def compare(results, baseline, tolerance):
+  '''
+  :return: list with descriptions of runs slower or with higher memory high-water mark than the baseline
+  '''
+  best = {}
+  for result in baseline['runs']:
+    key = case_key(result)
+    entry = best.setdefault(key, {'seconds': result['seconds'], 'max_rss_kib': None})
+    entry['seconds'] = min(entry['seconds'], result['seconds'])
+    # max_rss_kib is None on platforms without the resource module
+    rss = result['memory']['max_rss_kib']
+    if rss is not None and (entry['max_rss_kib'] is None or rss < entry['max_rss_kib']):
+      entry['max_rss_kib'] = rss
+  best_runs = {}
+  for result in results:
+    key = case_key(result)
+    if key not in best_runs or result['seconds'] < best_runs[key]['seconds']:
+      best_runs[key] = result
+  regressions = []
+  for key, result in sorted(best_runs.items()):
+    if key not in best:
+      continue
+    if result['seconds'] > best[key]['seconds'] * (1 + tolerance):
+      regressions.append("%s: %.3fs, baseline %.3fs" % (case_str(result), result['seconds'], best[key]['seconds']))
+    rss = result['memory']['max_rss_kib']
+    if rss is not None and best[key]['max_rss_kib'] is not None and rss > best[key]['max_rss_kib'] * (1 + tolerance):
+      regressions.append("%s: %d KiB, baseline %d KiB" % (case_str(result), rss, best[key]['max_rss_kib']))
+  return regressions
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Benchmark of the Lua plugin generation with synthetic JSIDL files')
+  parser.add_argument('-f', '--files', nargs='+', type=int, default=[10, 50], help='Counts of JSIDL files with type sets, Default: 10 50')
+  parser.add_argument('-m', '--messages', nargs='+', type=int, default=[10], help='Counts of messages per file, Default: 10')
+  parser.add_argument('-d', '--depth', nargs='+', type=int, default=[1, 4], help='Counts of type set references to resolve a declared type, Default: 1 4')
+  parser.add_argument('-x', '--cross_refs', nargs='+', type=int, default=[2], help='Counts of references to other type sets used in each message, Default: 2')
+  parser.add_argument('-r', '--repeat', type=int, default=1, help='Runs of each case, Default: 1')
+  parser.add_argument('-c', '--catalog', action='store_true', help='Write also the message catalog')
+  parser.add_argument('-t', '--tracemalloc', action='store_true', help='Trace the peak of memory allocated by Python, slows down the runs')
+  parser.add_argument('-o', '--output', help='Write results to this file, Default: stdout')
+  parser.add_argument('-b', '--baseline', help='Results of a previous benchmark to compare with')
+  parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed increase of time and memory compared to baseline, Default: 0.2')
+  parser.add_argument('--run-case', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  if args.run_case:
+    # the results are read from stdout, send the output of the generator to stderr
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+      result = run_case(json.loads(args.run_case))
+    finally:
+      sys.stdout = stdout
+    print(json.dumps(result))
+    sys.exit()
+  runs = []
+  for files, messages, depth, cross_refs in itertools.product(args.files, args.messages, args.depth, args.cross_refs):
+    case = {'files': files, 'messages': messages, 'depth': depth, 'cross_refs': cross_refs, 'catalog': args.catalog, 'tracemalloc': args.tracemalloc}
+    for run in range(args.repeat):
+      result = run_case_in_process(case)
+      result['run'] = run
+      runs.append(result)
+      sys.stderr.write("%s run=%d: %.3fs, %s KiB\n" % (case_str(result), run, result['seconds'], result['memory']['max_rss_kib']))
+  report = {'python': platform.python_version(), 'platform': platform.platform(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'runs': runs}
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+  else:
+    print(json.dumps(report, indent=2, sort_keys=True))
+  if args.baseline:
+    with open(args.baseline) as f:
+      regressions = compare(runs, json.load(f), args.tolerance)
+    for regression in regressions:
+      sys.stderr.write("regression: %s\n" % regression)
+    if regressions:
+      sys.exit(1)
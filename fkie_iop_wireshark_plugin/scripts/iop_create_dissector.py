@@ -26,6 +26,7 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 import argparse
 import sys
 
+from fkie_iop_wireshark_plugin.message_catalog import DEFAULT_CATALOG_PATH
 from fkie_iop_wireshark_plugin.parse_jsidl import Parse_JSIDL
 
 '''
@@ -35,6 +36,8 @@ if __name__ == "__main__":
   parser.add_argument('-i', "--input_path", help='Path to folder with JSIDL-files. If empty search for fkie_iop_builder ROS pacakge.')
   parser.add_argument('-o', "--output_path", help="path and name of the resulting LUA-script, Default: '~/.local/lib/wireshark/plugins/fkie_iop.lua'")
   parser.add_argument('-e', '--exclude', nargs='+', help='List with folder names to exclude from parsing')
+  parser.add_argument('-c', '--catalog', nargs='?', const=DEFAULT_CATALOG_PATH, help="Write also a message catalog to given path, Default: '%s'" % DEFAULT_CATALOG_PATH)
+  parser.add_argument('-w', '--watch', action='store_true', help='Stay resident and update the LUA-script on changes of JSIDL-files')
   args = parser.parse_args()
   input_path = args.input_path
   output_path = args.output_path
@@ -42,6 +45,8 @@ if __name__ == "__main__":
   if isinstance(args.exclude, list):
     exclude = args.exclude
   try:
-    path = Parse_JSIDL(input_path, output_path, exclude)
+    path = Parse_JSIDL(input_path, output_path, exclude, args.catalog)
+    if args.watch:
+      path.watch()
   except KeyboardInterrupt:
     sys.exit()
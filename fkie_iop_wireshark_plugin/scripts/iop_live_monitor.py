@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import sys
+
+from fkie_iop_wireshark_plugin.live_monitor import LiveMonitor
+from fkie_iop_wireshark_plugin.message_catalog import DEFAULT_CATALOG_PATH, MessageCatalog
+from fkie_iop_wireshark_plugin.pcap_index import IOP_UDP_PORTS, NO_MESSAGE_ID, component_str
+
+'''
+Shows rates, lost packets and decoded messages of live IOP traffic.
+'''
+
+
+class Report(object):
+
+  def __init__(self, catalog, message_ids, clear):
+    self.catalog = catalog
+    self.message_ids = message_ids
+    self.clear = clear
+
+  def message_name(self, message_id):
+    if message_id == NO_MESSAGE_ID:
+      return '[middle/last packets]'
+    if self.catalog is not None:
+      msg = self.catalog.message(message_id)
+      if msg is not None:
+        return msg.name
+    return ''
+
+  def __call__(self, monitor):
+    lines = []
+    drops = monitor.socket_drops()
+    lines.append("IOP live monitor %s  packets: %d  decoded: %d  header only: %d  incomplete: %d  invalid: %d  queue: %d/%d%s"
+                 % (datetime.datetime.fromtimestamp(monitor.now()).strftime('%H:%M:%S'), monitor.received, monitor.decoded_count,
+                    monitor.header_only, monitor.incomplete, monitor.invalid, monitor.queue.qsize() if monitor.queue else 0, monitor.queue_size,
+                    '' if drops is None else "  socket drops: %d" % drops))
+    lines.append("%-32s %10s %10s %10s %8s %8s %8s" % ('Component / Message', 'pkt/s', 'kB/s', 'total', 'lost', 'dup', 'reord'))
+    for rate in monitor.rates():
+      if rate.message_id is None:
+        streams = [stream for stream in monitor.streams.values() if stream.src == rate.src]
+        lines.append("%-32s %10.1f %10.1f %10d %8d %8d %8d" % (component_str(rate.src), rate.packets_per_sec, rate.bytes_per_sec / 1000.0, rate.total,
+                                                             sum([s.lost for s in streams]), sum([s.duplicate for s in streams]), sum([s.reordered for s in streams])))
+      else:
+        msg_id = '' if rate.message_id == NO_MESSAGE_ID else "0x%04X " % rate.message_id
+        lines.append("  %-30s %10.1f %10.1f %10d" % ((msg_id + self.message_name(rate.message_id))[:30], rate.packets_per_sec, rate.bytes_per_sec / 1000.0, rate.total))
+    for (src, message_id), decoded in sorted(monitor.decoded.items()):
+      if self.message_ids is None or message_id not in self.message_ids:
+        continue
+      lines.append('')
+      lines.append("0x%04X %s %s->%s SeqNr: %d%s" % (message_id, self.message_name(message_id), component_str(src), component_str(decoded.dst),
+                                                   decoded.seq_nr, '' if decoded.complete else ' [incomplete]'))
+      for path, value in decoded.fields:
+        lines.append("  %s: %s" % (path, value))
+    if self.clear:
+      sys.stdout.write('\033[H\033[2J')
+    print('\n'.join(lines))
+    sys.stdout.flush()
+
+
+def parse_message_ids(values, catalog):
+  result = set()
+  for value in values:
+    try:
+      result.add(int(value, 16) if value.lower().startswith('0x') else int(value))
+      continue
+    except ValueError:
+      pass
+    if catalog is None:
+      raise Exception("no message catalog to resolve message name '%s', create it with 'iop_create_dissector.py --catalog'" % value)
+    msgs = catalog.messages_by_name(value)
+    if not msgs:
+      raise Exception("message '%s' not found in catalog %s" % (value, catalog.path))
+    result.update([msg.message_id for msg in msgs])
+  return result
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Live view of IOP traffic received on UDP ports or from a pcap stream')
+  parser.add_argument('-p', '--ports', nargs='+', type=int, default=list(IOP_UDP_PORTS), help='UDP ports, Default: %s' % ' '.join([str(port) for port in IOP_UDP_PORTS]))
+  parser.add_argument('-a', '--address', default='0.0.0.0', help='Address to listen on, Default: 0.0.0.0')
+  parser.add_argument('-r', '--pcap', nargs='?', const='-', help="Read a pcap stream from a named pipe, a pcap file or stdin ('-') instead of the UDP ports, e.g. 'tcpdump -U -w - udp port 3794 | iop_live_monitor.py -r'")
+  parser.add_argument('-m', '--message', nargs='+', help='Show the last decoded packet of these message IDs (e.g. 0x4402) or names')
+  parser.add_argument('-c', '--catalog', default=DEFAULT_CATALOG_PATH, help="Message catalog with the field layouts, only headers are decoded without it, Default: '%s'" % DEFAULT_CATALOG_PATH)
+  parser.add_argument('-w', '--window', type=int, default=10, help='Seconds of the rolling rates, Default: 10')
+  parser.add_argument('-i', '--interval', type=float, default=1.0, help='Seconds between two reports, Default: 1')
+  parser.add_argument('-q', '--queue', type=int, default=1000, help='Count of packets waiting for payload decoding, further packets are decoded by header only, Default: 1000')
+  parser.add_argument('-t', '--stream_timeout', type=float, default=60.0, help='Seconds after which a stream without packets starts again in sequence analysis and idle components are removed, Default: 60')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+  catalog = None
+  if os.path.isfile(args.catalog):
+    catalog = MessageCatalog(args.catalog)
+  else:
+    logging.warning("Message catalog %s not found, only headers are decoded. Create it with 'iop_create_dissector.py --catalog'" % args.catalog)
+  try:
+    message_ids = parse_message_ids(args.message, catalog) if args.message else None
+    monitor = LiveMonitor(catalog, window=args.window, queue_size=args.queue, stream_timeout=args.stream_timeout)
+    report = Report(catalog, message_ids, sys.stdout.isatty())
+    if args.pcap is None:
+      source = monitor.listen_udp(args.address, args.ports)
+    elif args.pcap == '-':
+      source = monitor.read_pcap(sys.stdin.buffer)
+    else:
+      source = monitor.read_pcap(open(args.pcap, 'rb'))
+    asyncio.run(monitor.run(source, report, args.interval))
+  except KeyboardInterrupt:
+    pass
+  finally:
+    if catalog is not None:
+      catalog.close()
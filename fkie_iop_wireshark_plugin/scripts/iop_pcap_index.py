@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import argparse
+import datetime
+import os
+import sys
+
+from fkie_iop_wireshark_plugin.message_catalog import DEFAULT_CATALOG_PATH, MessageCatalog
+from fkie_iop_wireshark_plugin.pcap_index import NO_MESSAGE_ID, PacketIndex, component_id, component_str
+
+'''
+Creates an index of the IOP packets in a capture file and queries it by message, component and time.
+'''
+
+
+def parse_time(value):
+  # seconds since epoch or local date and time, e.g. '2024-05-03 14:10:00'
+  try:
+    return float(value)
+  except ValueError:
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def message_name(catalog, message_id):
+  if message_id == NO_MESSAGE_ID:
+    return '[no message ID]'
+  if catalog is not None:
+    msg = catalog.message(message_id)
+    if msg is not None:
+      return msg.name
+  return ''
+
+
+def parse_message_ids(values, catalog):
+  result = []
+  for value in values:
+    try:
+      result.append(int(value, 16) if value.lower().startswith('0x') else int(value))
+      continue
+    except ValueError:
+      pass
+    if catalog is None:
+      raise Exception("no message catalog to resolve message name '%s', create it with 'iop_create_dissector.py --catalog'" % value)
+    msgs = catalog.messages_by_name(value)
+    if not msgs:
+      raise Exception("message '%s' not found in catalog %s" % (value, catalog.path))
+    result += [msg.message_id for msg in msgs]
+  return result
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Index of IOP packets in a pcap or pcapng file')
+  parser.add_argument('pcap', help='Capture file')
+  parser.add_argument('-i', '--index', help="Path of the index file, Default: '<pcap>.iopidx'")
+  parser.add_argument('-r', '--rebuild', action='store_true', help='Create the index again, also if it is up to date')
+  parser.add_argument('-m', '--message', nargs='+', help='Message IDs (e.g. 0x4402) or names found in the message catalog')
+  parser.add_argument('-s', '--src', help='Source component ID, e.g. 5.1.1')
+  parser.add_argument('-d', '--dst', help='Destination component ID, e.g. 150.64.1')
+  parser.add_argument('--start', type=parse_time, help="Start time as seconds since epoch or local time, e.g. '2024-05-03 14:10:00'")
+  parser.add_argument('--end', type=parse_time, help='End time (exclusive), same format as --start')
+  parser.add_argument('-x', '--extract', help='Write the matching packets into this pcap file')
+  parser.add_argument('-c', '--catalog', default=DEFAULT_CATALOG_PATH, help="Message catalog to resolve message names, Default: '%s'" % DEFAULT_CATALOG_PATH)
+  args = parser.parse_args()
+  catalog = MessageCatalog(args.catalog) if os.path.isfile(args.catalog) else None
+  try:
+    with PacketIndex.open(args.pcap, args.index, args.rebuild) as index:
+      if not (args.message or args.src or args.dst or args.start is not None or args.end is not None or args.extract):
+        # summary of the indexed messages
+        for message_id, count in sorted(index.message_ids().items()):
+          print("0x%04X %8d %s" % (message_id, count, message_name(catalog, message_id)) if message_id != NO_MESSAGE_ID else "       %8d %s" % (count, message_name(catalog, message_id)))
+        sys.exit()
+      message_ids = parse_message_ids(args.message, catalog) if args.message else None
+      src = component_id(args.src) if args.src else None
+      dst = component_id(args.dst) if args.dst else None
+      records = index.query(message_ids, args.start, args.end, src, dst)
+      if args.extract:
+        index.extract(records, args.extract)
+        print("%d packets written to %s" % (len(records), args.extract))
+      else:
+        for rec in records:
+          timestamp = datetime.datetime.fromtimestamp(rec.timestamp_ns / 1e9).isoformat()
+          msg_id = '' if rec.message_id == NO_MESSAGE_ID else "0x%04X" % rec.message_id
+          print("%d\t%s\t%s\t%s\t%s->%s\tSeqNr: %d" % (rec.frame, timestamp, msg_id, message_name(catalog, rec.message_id), component_str(rec.src), component_str(rec.dst), rec.seq_nr))
+  except KeyboardInterrupt:
+    pass
+  finally:
+    if catalog is not None:
+      catalog.close()
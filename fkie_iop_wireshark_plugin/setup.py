@@ -5,7 +5,7 @@ from setuptools import setup
 from distutils.command.build_py import build_py
 
 package_name = 'fkie_iop_wireshark_plugin'
-scripts=['scripts/iop_create_dissector.py']
+scripts=['scripts/iop_create_dissector.py', 'scripts/iop_live_monitor.py', 'scripts/iop_pcap_index.py']
 packages=[package_name]
 package_dir={'': 'src'}
 
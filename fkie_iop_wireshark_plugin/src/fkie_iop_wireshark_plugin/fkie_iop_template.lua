@@ -17,6 +17,11 @@ pf_src_component_id = ProtoField.uint8("iop.src.component", "Component", base.DE
 pf_dst_subsystem_id = ProtoField.uint8("iop.dst.subsystem", "Subsystem", base.DEC, nil)
 pf_dst_node_id = ProtoField.uint8("iop.dst.node", "Node", base.DEC, nil)
 pf_dst_component_id = ProtoField.uint8("iop.dst.component", "Component", base.DEC, nil)
+pf_seq_nr = ProtoField.uint16("iop.seq_nr", "Sequence Number", base.DEC)
+pf_seq_expected = ProtoField.uint16("iop.seq.expected", "Expected Sequence Number", base.DEC)
+pf_seq_lost = ProtoField.uint16("iop.seq.lost", "Lost Packets", base.DEC)
+pf_seq_duplicate = ProtoField.bool("iop.seq.duplicate", "Duplicate Packet")
+pf_seq_reordered = ProtoField.bool("iop.seq.reordered", "Reordered Packet")
 
 
 proto.fields = {
@@ -35,7 +40,12 @@ proto.fields = {
     pf_src_component_id,
     pf_dst_subsystem_id,
     pf_dst_node_id,
-    pf_dst_component_id
+    pf_dst_component_id,
+    pf_seq_nr,
+    pf_seq_expected,
+    pf_seq_lost,
+    pf_seq_duplicate,
+    pf_seq_reordered
 }
 
 -- this table is for autogenerated message dissector
@@ -48,6 +58,33 @@ local my_info =
 }
 set_plugin_info(my_info)
 
+proto.prefs.seq_stream_timeout = Pref.uint("Sequence stream timeout", 60, "Seconds without packets after which a stream (source -> destination) is removed from the sequence number analysis")
+
+-- last sequence number, timestamp and lost sequence numbers per stream (source -> destination), updated on first pass only
+local seq_streams = {}
+-- lost packets arriving at most this count of sequence numbers late are reordered packets, other packets going
+-- back restart the stream, e.g. after a reboot of the component. Set by the generator (SEQ_REORDER_WINDOW in pcap_index.py)
+seq_reorder_window = 0
+-- sequence analysis results by frame number, only frames with lost, duplicated or reordered packets are stored
+local seq_analysis = {}
+local seq_last_sweep = 0
+
+-- enabled state of the message sets by preference name, filled by generated message dissectors
+set_enabled = {}
+
+function proto.prefs_changed()  -- copy the state of the message sets from preferences
+    for pref_name, _ in pairs(set_enabled) do
+        set_enabled[pref_name] = proto.prefs[pref_name]
+    end
+end
+
+function proto.init()  -- reset the sequence analysis on new capture or reload
+    seq_streams = {}
+    seq_analysis = {}
+    seq_last_sweep = 0
+    proto.prefs_changed()
+end
+
 
 function bitstr(value, bits_count)  -- creates a string with bit representation of an integer
     local t = {}
@@ -111,6 +148,65 @@ function bitVal(value, bit_start_pos, bit_end_pos)  -- returns number represente
 end
 
 
+function seq_analyze(pinfo, stream_key, seq_nr)  -- compares `seq_nr` with the last sequence number of the stream, returns nil if it is the expected one
+    local now = pinfo.abs_ts
+    local timeout = proto.prefs.seq_stream_timeout
+    if now - seq_last_sweep > timeout then
+        -- remove idle streams
+        for key, stream in pairs(seq_streams) do
+            if now - stream.ts > timeout then
+                seq_streams[key] = nil
+            end
+        end
+        seq_last_sweep = now
+    end
+    local stream = seq_streams[stream_key]
+    if stream == nil then
+        -- missing: frame number reporting the loss by lost sequence number within the reorder window
+        seq_streams[stream_key] = {seq = seq_nr, ts = now, missing = {}}
+        return nil
+    end
+    local result = nil
+    local expected = (stream.seq + 1) % 65536
+    -- distance to the last sequence number, sequence numbers wrap at 16 bit
+    local delta = (seq_nr - stream.seq) % 65536
+    if delta == 0 then
+        result = {expected = expected, duplicate = true}
+    elseif delta < 32768 then
+        if delta > 1 then
+            result = {expected = expected, lost = delta - 1}
+            for lost_delta = math.max(1, delta - seq_reorder_window), delta - 1 do
+                stream.missing[(stream.seq + lost_delta) % 65536] = pinfo.number
+            end
+            for missing_nr, _ in pairs(stream.missing) do
+                if (seq_nr - missing_nr) % 65536 > seq_reorder_window then
+                    stream.missing[missing_nr] = nil
+                end
+            end
+        end
+        stream.seq = seq_nr
+    elseif 65536 - delta <= seq_reorder_window and stream.missing[seq_nr] ~= nil then
+        -- late packet, it is no longer lost in the frame reporting the loss
+        local lost_frame = stream.missing[seq_nr]
+        stream.missing[seq_nr] = nil
+        local lost_result = seq_analysis[lost_frame]
+        if lost_result ~= nil and lost_result.lost ~= nil then
+            lost_result.lost = lost_result.lost - 1
+            if lost_result.lost == 0 then
+                seq_analysis[lost_frame] = nil
+            end
+        end
+        result = {expected = expected, reordered = true}
+    else
+        -- the stream was restarted
+        stream.seq = seq_nr
+        stream.missing = {}
+    end
+    stream.ts = now
+    return result
+end
+
+
 -- dissector for IOP message header
 function proto.dissector(buffer, pinfo, tree)
     length = buffer:len()
@@ -153,7 +249,29 @@ function proto.dissector(buffer, pinfo, tree)
         src_id_subtree:add(pf_src_component_id, buffer(9, 1))
         -- add sequence number
         local seq_nr = buffer(as5669a_length-2, 2):le_uint()
-        subtree:add_le(buffer(as5669a_length-2, 2), "Sequence Number: " .. seq_nr)
+        local seq_buf = buffer(as5669a_length-2, 2)
+        local seq_subtree = subtree:add_le(pf_seq_nr, seq_buf)
+        if not pinfo.visited then
+            seq_analysis[pinfo.number] = seq_analyze(pinfo, src_id .. "->" .. dst_id, seq_nr)
+        end
+        local seq_str = string.format("SeqNr: %d", seq_nr)
+        local seq_result = seq_analysis[pinfo.number]
+        if seq_result ~= nil then
+            seq_subtree:add(pf_seq_expected, seq_buf, seq_result.expected):set_generated()
+            if seq_result.lost ~= nil then
+                seq_subtree:add(pf_seq_lost, seq_buf, seq_result.lost):set_generated()
+                seq_subtree:add_expert_info(PI_SEQUENCE, PI_WARN, string.format("%d packet(s) lost, expected sequence number %d", seq_result.lost, seq_result.expected))
+                seq_str = string.format("%s [%d lost]", seq_str, seq_result.lost)
+            elseif seq_result.duplicate then
+                seq_subtree:add(pf_seq_duplicate, seq_buf, true):set_generated()
+                seq_subtree:add_expert_info(PI_SEQUENCE, PI_WARN, "Duplicate packet")
+                seq_str = string.format("%s [duplicate]", seq_str)
+            elseif seq_result.reordered then
+                seq_subtree:add(pf_seq_reordered, seq_buf, true):set_generated()
+                seq_subtree:add_expert_info(PI_SEQUENCE, PI_NOTE, string.format("Reordered packet, expected sequence number %d", seq_result.expected))
+                seq_str = string.format("%s [reordered]", seq_str)
+            end
+        end
         -- parse included message
         local messageid = 0
         local id_str = "unknown"
@@ -161,11 +279,11 @@ function proto.dissector(buffer, pinfo, tree)
         if bitAND(flags_val, 7) == 1 and bitAND(flags_val, 6) == 0 then
             id_str = "Middle Data Paket"
             subtree:append_text(string.format(", %s", id_str))
-            pinfo.cols.info:set(string.format('[middle] %s->%s, SeqNr: %d', src_id, dst_id, seq_nr));
+            pinfo.cols.info:set(string.format('[middle] %s->%s, %s', src_id, dst_id, seq_str));
         elseif bitAND(flags_val, 7) == 1 and bitAND(flags_val, 6) == 1 then
             id_str = "Last Data Paket"
             subtree:append_text(string.format(", %s", id_str))
-            pinfo.cols.info:set(string.format('[last] %s->%s, SeqNr: %d', src_id, dst_id, seq_nr));
+            pinfo.cols.info:set(string.format('[last] %s->%s, %s', src_id, dst_id, seq_str));
         else
             -- add message id
             if as5669a_length-1 >= 16 then
@@ -183,7 +301,7 @@ function proto.dissector(buffer, pinfo, tree)
             if packet_dissector ~= nil then
                 packet_dissector(buffer(13, buffer:len()-15):tvb(), pinfo, tree)
             end
-            pinfo.cols.info:set(string.format("%s, %s->%s, SeqNr: %d", tostring(pinfo.cols.info), src_id, dst_id, seq_nr))
+            pinfo.cols.info:set(string.format("%s, %s->%s, %s", tostring(pinfo.cols.info), src_id, dst_id, seq_str))
         end
     else
         -- handle compression
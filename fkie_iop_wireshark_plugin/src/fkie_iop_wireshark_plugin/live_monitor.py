@@ -0,0 +1,589 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import asyncio
+import collections
+import logging
+import os
+import socket
+import stat
+import struct
+import time
+
+from fkie_iop_wireshark_plugin.message_catalog import CatalogField
+from fkie_iop_wireshark_plugin.pcap_index import IOP_UDP_PORTS, NO_MESSAGE_ID, SEQ_REORDER_WINDOW, iop_header, pcap_file_header, transport_payload
+
+'''
+Live monitor of IOP traffic without Wireshark. Packets are received on the UDP ports of the plugin or read
+from a pcap stream, e.g. the output of 'tcpdump -U -w -'. The header of each packet is decoded when it
+arrives and updates the rates and sequence statistics. The payload is decoded with the field layout of the
+message catalog in a separate task. If this task falls behind and its queue is full, further packets are
+counted by header only until the queue has space again:
+
+  monitor = LiveMonitor(MessageCatalog())
+  asyncio.run(monitor.run(monitor.listen_udp(), report=print_report))
+'''
+
+# struct format of the JSIDL field types, all fields are little endian
+FIELD_FORMATS = {'byte': 'b', 'short integer': 'h', 'integer': 'i', 'long integer': 'q',
+                 'unsigned byte': 'B', 'unsigned short integer': 'H', 'unsigned integer': 'I', 'unsigned long integer': 'Q',
+                 'float': 'f', 'long float': 'd'}
+# count of queued packets decoded before the sockets are read again
+DECODE_BATCH = 32
+# count of datagrams read from a socket before other tasks run
+RECV_BATCH = 256
+# largest frame accepted from a pcap stream
+MAX_CAPLEN = 0x100000
+# bytes read at once from a pcap file
+READ_CHUNK_SIZE = 0x10000
+
+# fields: list of tuples (path, value), list items and array elements have the index appended to the path, e.g. 'Body.L[0].Item.V'
+# complete: False if the packet is shorter than the layout or contains elements which are not decoded
+DecodedMessage = collections.namedtuple('DecodedMessage', 'timestamp src dst message_id seq_nr fields complete')
+# message_id is None for the rate of all messages of a component
+Rate = collections.namedtuple('Rate', 'src message_id packets_per_sec bytes_per_sec total')
+
+
+class _FileReader(object):
+  '''
+  Reads a pcap stream from a regular file, which is not supported by connect_read_pipe(). The file is
+  read in chunks by a thread of the executor to keep the event loop running.
+  '''
+
+  def __init__(self, f):
+    self._file = f
+    self._buffer = bytearray()
+    self._eof = False
+
+  async def readexactly(self, n):
+    loop = asyncio.get_running_loop()
+    while len(self._buffer) < n and not self._eof:
+      data = await loop.run_in_executor(None, self._file.read, READ_CHUNK_SIZE)
+      if not data:
+        self._eof = True
+      self._buffer.extend(data)
+    if len(self._buffer) < n:
+      partial = bytes(self._buffer)
+      del self._buffer[:]
+      raise asyncio.IncompleteReadError(partial, n)
+    result = bytes(self._buffer[:n])
+    del self._buffer[:n]
+    return result
+
+
+class _Truncated(Exception):
+  pass
+
+
+class _LayoutNode(object):
+  '''
+  Element of the message layout created from the flat field list of the message catalog.
+  '''
+
+  def __init__(self, field):
+    self.kind = field.kind
+    self.path = field.path
+    self.name = field.path.rsplit('.', 1)[-1]
+    self.optional = field.optional
+    self.format = struct.Struct('<' + FIELD_FORMATS[field.field_type]) if field.field_type in FIELD_FORMATS else None
+    self.size = field.size
+    self.scale = None if field.scale_factor is None else (field.scale_factor, field.scale_bias)
+    # count field, vtag field or presence vector in front of the element
+    self.count = None
+    # product of the dimensions of an array
+    self.dimension = 1
+    self.children = []
+
+
+def build_layout(fields):
+  '''
+  :param fields: list of CatalogField of one message
+  :return: root of the layout tree
+  '''
+  root = _LayoutNode(CatalogField('', 'message', None, None, False, None, None))
+  stack = [root]
+  for field in fields:
+    while len(stack) > 1 and field.path != stack[-1].path and not field.path.startswith(stack[-1].path + '.'):
+      stack.pop()
+    parent = stack[-1]
+    if field.kind in ('count_field', 'vtag_field', 'presence_vector') and field.path == parent.path:
+      parent.count = struct.Struct('<' + FIELD_FORMATS[field.field_type])
+    elif field.kind == 'dimension':
+      parent.dimension *= field.size or 1
+    elif field.kind != 'sub_field':
+      # sub fields are part of the value of the bit field
+      node = _LayoutNode(field)
+      parent.children.append(node)
+      stack.append(node)
+  return root
+
+
+class PayloadDecoder(object):
+  '''
+  Decodes the fields of IOP messages with the field layout stored in the message catalog.
+  '''
+
+  def __init__(self, catalog=None):
+    self.catalog = catalog
+    self._layouts = {}
+
+  def layout(self, message_id):
+    '''
+    :return: root of the layout tree or None if the message ID is not in the catalog
+    '''
+    try:
+      return self._layouts[message_id]
+    except KeyError:
+      fields = self.catalog.fields(message_id) if self.catalog is not None else []
+      layout = build_layout(fields) if fields else None
+      self._layouts[message_id] = layout
+      return layout
+
+  def decode(self, message_id, data):
+    '''
+    :param data: message beginning with the message ID, without IOP header and sequence number
+    :return: tuple (list of (path, value), complete) or None if the layout of the message is unknown
+    '''
+    layout = self.layout(message_id)
+    if layout is None:
+      return None
+    fields = []
+    try:
+      self._decode_children(layout, memoryview(data), 0, '', fields)
+      complete = True
+    except (_Truncated, struct.error):
+      complete = False
+    return fields, complete
+
+  def _decode_children(self, node, buf, offset, path, fields):
+    presence = None
+    if node.count is not None:
+      presence = node.count.unpack_from(buf, offset)[0]
+      offset += node.count.size
+    bit = 0
+    for child in node.children:
+      if child.optional:
+        # the bits of the presence vector are assigned to the optional elements in order
+        present = presence is None or (presence >> bit) & 1
+        bit += 1
+        if not present:
+          continue
+      offset = self._decode_element(child, buf, offset, path, fields)
+    return offset
+
+  def _decode_element(self, node, buf, offset, path, fields):
+    kind = node.kind
+    path = "%s.%s" % (path, node.name) if path else node.name
+    if node.format is not None and kind in ('fixed_field', 'bit_field'):
+      value = node.format.unpack_from(buf, offset)[0]
+      if node.scale is not None:
+        value = value * node.scale[0] + node.scale[1]
+      fields.append((path, value))
+      return offset + node.format.size
+    if kind == 'fixed_length_string':
+      return self._decode_string(buf, offset, node.size, path, fields)
+    if kind == 'variable_length_string':
+      count = node.count.unpack_from(buf, offset)[0]
+      return self._decode_string(buf, offset + node.count.size, count, path, fields)
+    if kind in ('header', 'body', 'footer', 'record', 'sequence'):
+      return self._decode_children(node, buf, offset, path, fields)
+    if kind in ('list', 'array'):
+      if kind == 'list':
+        count = node.count.unpack_from(buf, offset)[0]
+        offset += node.count.size
+      else:
+        count = node.dimension
+      for idx in range(count):
+        start = offset
+        for child in node.children:
+          offset = self._decode_element(child, buf, offset, "%s[%d]" % (path, idx), fields)
+        if offset == start:
+          # items without content, e.g. all optional
+          break
+      return offset
+    if kind == 'variant':
+      vtag = node.count.unpack_from(buf, offset)[0]
+      if vtag >= len(node.children):
+        raise _Truncated()
+      return self._decode_element(node.children[vtag], buf, offset + node.count.size, path, fields)
+    if kind in ('variable_length_field', 'variable_format_field'):
+      if kind == 'variable_format_field':
+        # format field in front of the count field
+        offset += 1
+      count = node.count.unpack_from(buf, offset)[0]
+      offset += node.count.size
+      if offset + count > len(buf):
+        raise _Truncated()
+      fields.append((path, bytes(buf[offset:offset + count])))
+      return offset + count
+    # e.g. variable_field, the layout in the catalog is not sufficient to decode it
+    raise _Truncated()
+
+  def _decode_string(self, buf, offset, length, path, fields):
+    if offset + length > len(buf):
+      raise _Truncated()
+    fields.append((path, bytes(buf[offset:offset + length]).split(b'\x00', 1)[0].decode('utf-8', 'replace')))
+    return offset + length
+
+
+class RollingRate(object):
+  '''
+  Count of packets and bytes of the last `window` seconds in buckets of one second.
+  '''
+
+  def __init__(self, window=10):
+    self.window = window
+    # one bucket more for the current second, which is not complete
+    self._packets = [0] * (window + 1)
+    self._bytes = [0] * (window + 1)
+    self._second = None
+    self.total = 0
+    # time of the last packet
+    self.last_timestamp = None
+
+  def _advance(self, second):
+    if self._second is None:
+      self._second = second
+    elif second > self._second:
+      for sec in range(self._second + 1, min(second, self._second + len(self._packets)) + 1):
+        self._packets[sec % len(self._packets)] = 0
+        self._bytes[sec % len(self._bytes)] = 0
+      self._second = second
+
+  def add(self, timestamp, size):
+    second = int(timestamp)
+    self._advance(second)
+    # late packets are counted in the current second
+    idx = max(second, self._second) % len(self._packets)
+    self._packets[idx] += 1
+    self._bytes[idx] += size
+    self.total += 1
+    self.last_timestamp = timestamp
+
+  def rate(self, now):
+    '''
+    :return: tuple (packets per second, bytes per second) of the last complete seconds
+    '''
+    self._advance(int(now))
+    if self._second is None:
+      return 0.0, 0.0
+    current = self._second % len(self._packets)
+    return (sum(self._packets) - self._packets[current]) / self.window, (sum(self._bytes) - self._bytes[current]) / self.window
+
+
+class StreamStats(object):
+  '''
+  Sequence number analysis of one stream (source ID -> destination ID), same rule as seq_analyze() in the Wireshark plugin.
+  '''
+
+  def __init__(self, src, dst):
+    self.src = src
+    self.dst = dst
+    self.seq = None
+    self.timestamp = None
+    # lost sequence numbers within SEQ_REORDER_WINDOW
+    self._missing = set()
+    self.received = 0
+    self.lost = 0
+    self.duplicate = 0
+    self.reordered = 0
+
+  def update(self, seq_nr, timestamp, timeout):
+    self.received += 1
+    if self.seq is None or timestamp - self.timestamp > timeout:
+      # first packet or the stream was restarted
+      self.seq = seq_nr
+      self._missing = set()
+    else:
+      # distance to the last sequence number, sequence numbers wrap at 16 bit
+      delta = (seq_nr - self.seq) % 65536
+      if delta == 0:
+        self.duplicate += 1
+      elif delta < 32768:
+        if delta > 1:
+          self.lost += delta - 1
+          self._missing.update([(self.seq + lost_delta) % 65536 for lost_delta in range(max(1, delta - SEQ_REORDER_WINDOW), delta)])
+          self._missing = set([nr for nr in self._missing if (seq_nr - nr) % 65536 <= SEQ_REORDER_WINDOW])
+        self.seq = seq_nr
+      elif 65536 - delta <= SEQ_REORDER_WINDOW and seq_nr in self._missing:
+        # late packet, it was counted as lost
+        self._missing.discard(seq_nr)
+        self.lost -= 1
+        self.reordered += 1
+      else:
+        # going back, e.g. the component was restarted
+        self.seq = seq_nr
+        self._missing = set()
+    self.timestamp = timestamp
+
+
+class LiveMonitor(object):
+  '''
+  Statistics and decoded payload of live IOP traffic. The packets are passed to packet_received() by
+  listen_udp() or read_pcap(), run() starts the decoding of the payload.
+  '''
+
+  def __init__(self, catalog=None, window=10, queue_size=1000, stream_timeout=60):
+    '''
+    :param catalog: MessageCatalog with the field layout, only headers are decoded if None
+    :param int window: seconds of the rolling rates
+    :param int queue_size: count of packets waiting for payload decoding, further packets are decoded by header only
+    :param float stream_timeout: seconds after which a stream without packets starts again in sequence analysis,
+      components, messages and streams without packets for this time are removed
+    '''
+    self.decoder = PayloadDecoder(catalog)
+    self.window = window
+    self.queue_size = queue_size
+    self.stream_timeout = stream_timeout
+    self.queue = None
+    # src: RollingRate
+    self.components = {}
+    # (src, message_id): RollingRate
+    self.messages = {}
+    # (src, dst): StreamStats
+    self.streams = {}
+    # (src, message_id): DecodedMessage, the last decoded packet
+    self.decoded = {}
+    self.received = 0
+    self.invalid = 0
+    self.decoded_count = 0
+    self.header_only = 0
+    self.incomplete = 0
+    # difference between capture time and local time of packets read from a pcap stream
+    self._clock_offset = None
+    self._last_sweep = None
+    self._sockets = []
+
+  def now(self):
+    '''
+    :return: current time in the clock of the received packets
+    '''
+    return time.time() + (self._clock_offset or 0.0)
+
+  def packet_received(self, payload, timestamp):
+    '''
+    Decodes the header of an IOP packet and queues it for payload decoding.
+    :param bytes payload: UDP or TCP payload
+    :param float timestamp: receive time in seconds since epoch
+    '''
+    header = iop_header(payload)
+    if header is None:
+      self.invalid += 1
+      return
+    message_id, src, dst, seq_nr, data_flags = header
+    self.received += 1
+    if self._last_sweep is None:
+      self._last_sweep = timestamp
+    elif timestamp - self._last_sweep > self.stream_timeout:
+      self._remove_idle(timestamp)
+    size = len(payload)
+    try:
+      self.components[src].add(timestamp, size)
+    except KeyError:
+      self.components[src] = RollingRate(self.window)
+      self.components[src].add(timestamp, size)
+    try:
+      self.messages[(src, message_id)].add(timestamp, size)
+    except KeyError:
+      self.messages[(src, message_id)] = RollingRate(self.window)
+      self.messages[(src, message_id)].add(timestamp, size)
+    try:
+      stream = self.streams[(src, dst)]
+    except KeyError:
+      stream = self.streams[(src, dst)] = StreamStats(src, dst)
+    stream.update(seq_nr, timestamp, self.stream_timeout)
+    if message_id == NO_MESSAGE_ID or self.queue is None or self.decoder.layout(message_id) is None:
+      return
+    try:
+      self.queue.put_nowait((timestamp, header, payload))
+    except asyncio.QueueFull:
+      # overload, decode only the header
+      self.header_only += 1
+
+  def _remove_idle(self, timestamp):
+    # like the plugin the statistics of components and streams without packets for stream_timeout are removed,
+    # otherwise they grow with each new address or stream on a long running bus
+    timeout = self.stream_timeout
+    for key in [key for key, rate in self.components.items() if timestamp - rate.last_timestamp > timeout]:
+      del self.components[key]
+    for key in [key for key, rate in self.messages.items() if timestamp - rate.last_timestamp > timeout]:
+      del self.messages[key]
+      self.decoded.pop(key, None)
+    for key in [key for key, stream in self.streams.items() if timestamp - stream.timestamp > timeout]:
+      del self.streams[key]
+    self._last_sweep = timestamp
+
+  def _decode(self, timestamp, header, payload):
+    message_id, src, dst, seq_nr, _data_flags = header
+    try:
+      fields, complete = self.decoder.decode(message_id, payload[13:-2])
+    except Exception as err:
+      # a broken layout or catalog must not stop the decoding of further packets
+      logging.debug("decoding of message 0x%04X failed: %s" % (message_id, err))
+      fields, complete = [], False
+    self.decoded_count += 1
+    if not complete:
+      self.incomplete += 1
+    self.decoded[(src, message_id)] = DecodedMessage(timestamp, src, dst, message_id, seq_nr, fields, complete)
+
+  async def _decode_loop(self):
+    while True:
+      self._decode(*(await self.queue.get()))
+      self.queue.task_done()
+      # get() does not suspend while the queue is not empty, let the sockets be read after a batch
+      for _ in range(min(self.queue.qsize(), DECODE_BATCH - 1)):
+        self._decode(*self.queue.get_nowait())
+        self.queue.task_done()
+      await asyncio.sleep(0)
+
+  async def _report_loop(self, report, interval):
+    while True:
+      await asyncio.sleep(interval)
+      report(self)
+
+  async def run(self, source, report=None, interval=1.0):
+    '''
+    Decodes the packets until the source is finished.
+    :param source: coroutine passing the packets, e.g. listen_udp() or read_pcap()
+    :param report: called with this monitor every `interval` seconds and at the end
+    '''
+    self.queue = asyncio.Queue(self.queue_size)
+    tasks = [asyncio.ensure_future(self._decode_loop())]
+    if report is not None:
+      tasks.append(asyncio.ensure_future(self._report_loop(report, interval)))
+    try:
+      await source
+      # decode the remaining packets of a finished pcap stream
+      await self.queue.join()
+    finally:
+      for task in tasks:
+        task.cancel()
+      await asyncio.gather(*tasks, return_exceptions=True)
+      if report is not None:
+        report(self)
+
+  def _socket_readable(self, sock):
+    # reads all waiting datagrams, the event loop is entered once for a burst instead of once for each datagram
+    timestamp = time.time()
+    for _ in range(RECV_BATCH):
+      try:
+        data = sock.recv(65535)
+      except (BlockingIOError, InterruptedError):
+        return
+      self.packet_received(data, timestamp)
+
+  async def listen_udp(self, host='0.0.0.0', ports=IOP_UDP_PORTS, rcvbuf=4 * 1024 * 1024):
+    '''
+    Receives packets on the UDP ports until cancelled.
+    :param int rcvbuf: receive buffer of the sockets to bridge short bursts, limited by net.core.rmem_max
+    '''
+    loop = asyncio.get_running_loop()
+    try:
+      for port in ports:
+        sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_DGRAM)
+        self._sockets.append(sock)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.setblocking(False)
+        sock.bind((host, port))
+        loop.add_reader(sock.fileno(), self._socket_readable, sock)
+      await loop.create_future()
+    finally:
+      for sock in self._sockets:
+        loop.remove_reader(sock.fileno())
+        sock.close()
+      self._sockets = []
+
+  def socket_drops(self):
+    '''
+    :return: count of datagrams dropped by the kernel because the receive buffers of the sockets were full,
+      None if not available (only on Linux). These packets are also reported as lost in the streams.
+    '''
+    inodes = set([str(os.fstat(sock.fileno()).st_ino) for sock in self._sockets])
+    if not inodes:
+      return None
+    drops = 0
+    try:
+      for path in ('/proc/net/udp', '/proc/net/udp6'):
+        with open(path) as f:
+          for line in f.readlines()[1:]:
+            columns = line.split()
+            if columns[9] in inodes:
+              drops += int(columns[12])
+    except (IOError, OSError, IndexError, ValueError):
+      return None
+    return drops
+
+  async def read_pcap(self, pipe):
+    '''
+    Reads packets from a pcap stream until it is closed, e.g. stdin, a named pipe or a pcap file. pcapng is not supported.
+    '''
+    loop = asyncio.get_running_loop()
+    transport = None
+    mode = os.fstat(pipe.fileno()).st_mode
+    if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode):
+      reader = asyncio.StreamReader()
+      transport, _protocol = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    else:
+      reader = _FileReader(pipe)
+    try:
+      try:
+        header = await reader.readexactly(24)
+      except asyncio.IncompleteReadError:
+        raise Exception("no pcap stream")
+      if header[:4] == b'\x0a\x0d\x0d\x0a':
+        raise Exception("pcapng is not supported for streams, use 'tcpdump -U -w -' or 'dumpcap -P -w -'")
+      endian, ns_factor, linktype = pcap_file_header(header)
+      record = struct.Struct(endian + 'IIII')
+      while True:
+        try:
+          ts_sec, ts_frac, caplen, _origlen = record.unpack(await reader.readexactly(record.size))
+          if caplen > MAX_CAPLEN:
+            raise Exception("invalid pcap record with %d bytes" % caplen)
+          frame = await reader.readexactly(caplen)
+        except asyncio.IncompleteReadError:
+          break
+        timestamp = ts_sec + ts_frac * ns_factor / 1e9
+        if self._clock_offset is None:
+          self._clock_offset = timestamp - time.time()
+        try:
+          payload = transport_payload(frame, linktype)
+        except (IndexError, struct.error):
+          # truncated frame
+          continue
+        if payload is not None:
+          self.packet_received(payload, timestamp)
+    finally:
+      if transport is not None:
+        transport.close()
+
+  def rates(self):
+    '''
+    :return: list of Rate for each component followed by the rates of its messages, sorted by component ID
+    '''
+    now = self.now()
+    result = []
+    for src in sorted(self.components):
+      result.append(Rate(src, None, *self.components[src].rate(now), total=self.components[src].total))
+      for (msg_src, message_id) in sorted([key for key in self.messages if key[0] == src]):
+        rate = self.messages[(msg_src, message_id)]
+        result.append(Rate(src, message_id, *rate.rate(now), total=rate.total))
+    return result
@@ -0,0 +1,163 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import collections
+import errno
+import os
+import sqlite3
+
+'''
+Catalog of all IOP messages found in JSIDL files, stored in a SQLite database.
+It is written by Parse_JSIDL and can be read without PyXB or the generated JSIDL bindings:
+
+  catalog = MessageCatalog()
+  msg = catalog.message(0x4402)
+  for field in catalog.fields(0x4402):
+    print(field.path, field.kind, field.size)
+'''
+
+DEFAULT_CATALOG_PATH = os.path.expanduser("~/.local/share/fkie_iop_wireshark_plugin/messages.db")
+
+# message_id: integer, set_*: name, id and version of the declared type set or service containing the message
+CatalogMessage = collections.namedtuple('CatalogMessage', 'message_id name filename set_name set_id set_version')
+# path: names of the parent elements and field joined by '.', kind: JSIDL element name, e.g. 'fixed_field'
+# size: bytes of fixed sized fields, length of fixed length strings or count of array dimension, else None
+CatalogField = collections.namedtuple('CatalogField', 'path kind field_type size optional scale_factor scale_bias')
+
+_SCHEMA = '''
+CREATE TABLE messages (
+  message_id INTEGER PRIMARY KEY,
+  name TEXT NOT NULL,
+  filename TEXT NOT NULL,
+  set_name TEXT,
+  set_id TEXT,
+  set_version TEXT
+);
+CREATE INDEX messages_name ON messages (name);
+CREATE TABLE fields (
+  message_id INTEGER NOT NULL,
+  idx INTEGER NOT NULL,
+  path TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  field_type TEXT,
+  size INTEGER,
+  optional INTEGER NOT NULL,
+  scale_factor REAL,
+  scale_bias REAL,
+  PRIMARY KEY (message_id, idx)
+) WITHOUT ROWID;
+'''
+
+
+def write_catalog(path, messages):
+  '''
+  Writes the catalog to `path`, an existing catalog will be replaced at once.
+  :param messages: list with tuples of (CatalogMessage, list of CatalogField)
+  '''
+  try:
+    os.makedirs(os.path.dirname(path))
+  except OSError as e:
+    if e.errno != errno.EEXIST:
+      raise
+  tmp_path = "%s.tmp" % path
+  if os.path.exists(tmp_path):
+    os.remove(tmp_path)
+  conn = sqlite3.connect(tmp_path)
+  try:
+    conn.executescript(_SCHEMA)
+    conn.executemany('INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)', [tuple(msg) for msg, _fields in messages])
+    conn.executemany('INSERT INTO fields VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(msg.message_id, idx) + tuple(field) for msg, fields in messages for idx, field in enumerate(fields)])
+    conn.commit()
+  finally:
+    conn.close()
+  os.replace(tmp_path, path)
+
+
+class MessageCatalog(object):
+  '''
+  Read access to a catalog written by Parse_JSIDL. All messages are loaded on first access,
+  fields are read on demand and cached.
+  '''
+
+  def __init__(self, path=DEFAULT_CATALOG_PATH):
+    if not os.path.isfile(path):
+      raise IOError(errno.ENOENT, "Message catalog not found, create it with 'iop_create_dissector.py --catalog'", path)
+    self.path = path
+    self._conn = sqlite3.connect(path)
+    self._messages = None
+    self._names = None
+    self._fields = {}
+
+  def close(self):
+    self._conn.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def _load(self):
+    self._messages = {}
+    self._names = {}
+    for row in self._conn.execute('SELECT message_id, name, filename, set_name, set_id, set_version FROM messages'):
+      msg = CatalogMessage(*row)
+      self._messages[msg.message_id] = msg
+      self._names.setdefault(msg.name, []).append(msg)
+
+  def messages(self):
+    '''
+    :return: all messages sorted by message ID
+    '''
+    if self._messages is None:
+      self._load()
+    return [self._messages[msg_id] for msg_id in sorted(self._messages)]
+
+  def message(self, message_id):
+    '''
+    :param int message_id: IOP message ID, e.g. 0x4402
+    :return: CatalogMessage or None if the ID is unknown
+    '''
+    if self._messages is None:
+      self._load()
+    return self._messages.get(message_id)
+
+  def messages_by_name(self, name):
+    '''
+    :return: list with all messages with given name, usually only one
+    '''
+    if self._names is None:
+      self._load()
+    return list(self._names.get(name, []))
+
+  def fields(self, message_id):
+    '''
+    :return: list of CatalogField in order of the message layout, empty list for unknown ID or if the layout could not be resolved
+    '''
+    try:
+      return self._fields[message_id]
+    except KeyError:
+      rows = self._conn.execute('SELECT path, kind, field_type, size, optional, scale_factor, scale_bias FROM fields WHERE message_id = ? ORDER BY idx', (message_id,))
+      result = [CatalogField(path, kind, field_type, size, bool(optional), scale_factor, scale_bias) for path, kind, field_type, size, optional, scale_factor, scale_bias in rows]
+      self._fields[message_id] = result
+      return result
@@ -20,15 +20,23 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
+import ast
+import collections
+import copy
 import errno
 import fnmatch
+import operator
 import os
 import re
 import sys
+import time
+import xml.etree.ElementTree as ET
 
 import logging
 logging.basicConfig(level=logging.INFO)
 
+from fkie_iop_wireshark_plugin.pcap_index import SEQ_REORDER_WINDOW
+
 '''
 The main of the ROS node for jsdil parser
 
@@ -64,68 +72,363 @@ def get_pkg_path(package_name):
   return ''
 
 
+_ARITHMETIC_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+'''
+Evaluates an arithmetic expression like 'ref.MAX_VALUE * 2 + 1' without eval().
+Only numbers, (namespaced) names, + - * / // % ** and parentheses are allowed.
+`resolve` is called with the dotted name of each constant and returns its value.
+'''
+def eval_arithmetic(expression, resolve):
+  def _dotted_name(node):
+    if isinstance(node, ast.Name):
+      return node.id
+    if isinstance(node, ast.Attribute):
+      return '%s.%s' % (_dotted_name(node.value), node.attr)
+    raise ValueError("unsupported expression '%s'" % expression)
+
+  def _eval(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+      return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC_OPERATORS:
+      left = _eval(node.left)
+      right = _eval(node.right)
+      if isinstance(node.op, ast.Pow) and abs(right) > 64:
+        raise ValueError("exponent too large in '%s'" % expression)
+      return _ARITHMETIC_OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _ARITHMETIC_OPERATORS:
+      return _ARITHMETIC_OPERATORS[type(node.op)](_eval(node.operand))
+    if isinstance(node, (ast.Name, ast.Attribute)):
+      return resolve(_dotted_name(node))
+    raise ValueError("unsupported expression '%s'" % expression)
+
+  try:
+    tree = ast.parse(expression.strip(), mode='eval')
+  except SyntaxError:
+    raise ValueError("invalid expression '%s'" % expression)
+  return _eval(tree.body)
+
+
 class Parse_JSIDL:
   
   TAB = '\t'
+  # maximal count of parsed JSIDL documents kept in memory, documents not referenced by the files still
+  # to parse are released before
+  DOC_CACHE_SIZE = 32
+  # elements preceding the references to other sets, see _index_xml_files()
+  REFERENCE_SCAN_ELEMENTS = ['description', 'assumptions', 'references', 'inherits_from', 'client_of', 'declared_const_set', 'declared_type_set']
+  # fixed-size elements decoded at constant offsets, bufidx is updated once after a run of them
+  FOLDED_ELEMENTS = ['fixed_field', 'bit_field', 'fixed_length_string', 'presence_vector', 'declared_fixed_field', 'declared_bit_field']
+  # elements containing other elements, which are checked separately if the size is not static
+  CONTAINER_ELEMENTS = ['record', 'sequence', 'array', 'declared_record', 'declared_array']
+  # elements not describing the message layout
+  CATALOG_SKIPPED_ELEMENTS = ['description', 'value_set', 'declared_value_set', 'value_enum', 'value_range', 'scale_range', 'bit_range', 'format_field', 'format_enum']
   
-  def __init__(self, input_path=None, output_path=None, exclude=[]):
+  def __init__(self, input_path=None, output_path=None, exclude=[], catalog_path=None):
     if output_path is None:
       output_path = os.path.expanduser("~/.local/lib/wireshark/plugins/fkie_iop.lua")
       logging.info("Write lua to default path: %s" % (output_path))
     else:
       logging.info("Write lua to: %s" % (output_path))
+    self.output_path = output_path
     try:
       # create output directory if not exists
       os.makedirs(os.path.dirname(output_path))
     except OSError as e:
       if e.errno != errno.EEXIST:
         raise
-    # open lua file to write parsed messages
-    with open(output_path, 'w+') as self.lua_file:
+    if input_path is None:
+      input_path = get_pkg_path("fkie_iop_builder")
+      input_path = os.path.join(input_path, "jsidl")
+      logging.info("Read from default jsidl input path: %s" % (input_path))
+    else:
+      input_path = os.path.abspath(input_path)
+      logging.info("Read jsidl files from: %s" % (input_path))
+    self.input_path = input_path
+    self.exclude = exclude
+    # path of the message catalog, no catalog is written if None
+    self.catalog_path = catalog_path
+
+    # create a set with all xml files found in input_path
+    self.xml_files = self._find_xml_files()
+    # parsed documents, least recently used first
+    self.doc_files = collections.OrderedDict()
+    # constants visible per file and evaluated (expression, file) pairs
+    self._const_tables = {}
+    self._const_values = {}
+    self._xml_file_ids = {}
+    # (id, version) of the sets referenced by each file
+    self._xml_file_refs = {}
+    self._index_xml_files(self.xml_files)
+    # generated dissectors and referenced files (type and const sets) for each JSIDL file
+    self._file_messages = {}
+    self._file_deps = {}
+    # catalog entries (CatalogMessage, [CatalogField]) for each JSIDL file
+    self._catalog_entries = {}
+    # preference name and label of the set containing the messages for each JSIDL file
+    self._file_sets = {}
+    current_idx = 0  # counter for debug output
+    self._message_count = 0
+    self._message_failed = []
+    self._message_ids = dict()
+    self._message_doubles = []
+    # files with skipped messages by message ID
+    self._skipped_ids = dict()
+    # (minimal size, static size) of elements in the current message, see _element_size()
+    self._size_cache = {}
+    # True while parsing elements already covered by a length check
+    self._in_guarded_segment = False
+    # offset of folded fields not yet added to bufidx and whether the current elements can be folded
+    self._offset = 0
+    self._folding = False
+    # count of files still to parse which need the document of a file
+    used_files = dict([(xmlfile, self._used_files(xmlfile)) for xmlfile in self.xml_files])
+    doc_users = collections.Counter()
+    for files in used_files.values():
+      doc_users.update(files)
+    # parse all files found in input_path
+    for xmlfile in sorted(self.xml_files):
+      current_idx += 1
+      logging.debug("Parse [%d/%d]: %s" % (current_idx, len(self.xml_files), xmlfile))
+      self.parse_jsidl_file(xmlfile)
+      for used_file in used_files.pop(xmlfile):
+        doc_users[used_file] -= 1
+        if doc_users[used_file] <= 0:
+          self.doc_files.pop(used_file, None)
+    self.write_lua()
+    logging.info("%d message types found" % self._message_count)
+    self._log_errors()
+    logging.info("Wireshark plugin was written to: %s" % (output_path))
+    if self.catalog_path:
+      self.write_catalog()
+      logging.info("Message catalog was written to: %s" % (self.catalog_path))
+
+  def _find_xml_files(self):
+    xml_files = set()
+    for root, _dirnames, filenames in os.walk(self.input_path):
+      subdirs = root.replace(self.input_path, '').split(os.path.sep)
+      if not (set(subdirs) & set(self.exclude)):
+        for filename in fnmatch.filter(filenames, '*.xml'):
+          xmlfile = os.path.join(root, filename)
+          xml_files.add(os.path.join(root, xmlfile))
+      else:
+        logging.debug("Skip folder: %s" % root)
+    return xml_files
+
+  def _log_errors(self):
+    if self._message_failed:
+      logging.warning("Parse errors in %d message types: \n\t%s" % (len(self._message_failed), '\n\t'.join(["%s: %s" % (msgname, fname) for msgname, fname in self._message_failed])))
+    if self._message_doubles:
+      logging.warning("Skipped %d message types, their name was already been parsed. See warnings for details!" % (len(self._message_doubles)))
+
+  def write_lua(self):
+    # write into a temporary file and replace the plugin at once, so Wireshark never loads a partial file
+    tmp_path = "%s.tmp" % self.output_path
+    with open(tmp_path, 'w') as lua_file:
       # copy template script to lua plugin
       with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fkie_iop_template.lua")) as f_input:
-        for line in f_input.readlines():
-            self.lua_file.write(line)
-      if input_path is None:
-        input_path = get_pkg_path("fkie_iop_builder")
-        input_path = os.path.join(input_path, "jsidl")
-        logging.info("Read from default jsidl input path: %s" % (input_path))
-      else:
-        input_path = os.path.abspath(input_path)
-        logging.info("Read jsidl files from: %s" % (input_path))
-
-      # create a set with all xml files found in input_path
-      self.xml_files = set()
-      self.doc_files = {}
-      for root, _dirnames, filenames in os.walk(input_path):
-        subdirs = root.replace(input_path, '').split(os.path.sep)
-        if not (set(subdirs) & set(exclude)):
-          for filename in fnmatch.filter(filenames, '*.xml'):
-            xmlfile = os.path.join(root, filename)
-            self.xml_files.add(os.path.join(root, xmlfile))
-        else:
-          logging.debug("Skip folder: %s" % root)
-      current_idx = 0  # counter for debug output
+        lua_file.write(f_input.read())
+      lua_file.write(LINE('seq_reorder_window = %d' % SEQ_REORDER_WINDOW, 0))
+      # add a preference for each set with messages to enable or disable decoding of its messages
+      set_prefs = dict([self._file_sets[xmlfile] for xmlfile in self._file_messages if self._file_messages[xmlfile]])
+      for pref_name in sorted(set_prefs):
+        lua_file.write(LINE('proto.prefs.%s = Pref.bool("Decode %s", true, "Decode messages of %s, otherwise only the message name is shown")' % (pref_name, set_prefs[pref_name], set_prefs[pref_name]), 0))
+        lua_file.write(LINE('set_enabled["%s"] = true' % pref_name, 0))
+      lua_file.write('\n')
+      for xmlfile in sorted(self._file_messages):
+        lua_file.writelines(self._file_messages[xmlfile])
+    os.replace(tmp_path, self.output_path)
+
+  def write_catalog(self):
+    from fkie_iop_wireshark_plugin.message_catalog import write_catalog
+    entries = []
+    for xmlfile in sorted(self._catalog_entries):
+      entries.extend(self._catalog_entries[xmlfile])
+    write_catalog(self.catalog_path, entries)
+
+  def update(self, changed_files):
+    '''
+    Parses again the changed (also added or removed) files, all files referencing them and all files
+    with the same message IDs and writes the Lua plugin, the result is the same as of a full parse.
+    If a file can not be parsed, the plugin and the catalog are not changed.
+    :return: set of parsed files or None on errors
+    '''
+    state = self._copy_state()
+    self.xml_files = self._find_xml_files()
+    for xml_file in changed_files:
+      self.doc_files.pop(xml_file, None)
+      self._xml_file_refs.pop(xml_file, None)
+      for files in self._xml_file_ids.values():
+        if xml_file in files:
+          files.remove(xml_file)
+    self._index_xml_files(changed_files & self.xml_files)
+    affected = set(changed_files)
+    while True:
+      self._add_affected_files(affected)
+      self._remove_file_results(affected)
       self._message_count = 0
       self._message_failed = []
-      self._message_ids = dict()
       self._message_doubles = []
-      # parse all files found in input_path
-      for xmlfile in sorted(self.xml_files):
-        current_idx += 1
-        logging.debug("Parse [%d/%d]: %s" % (current_idx, len(self.xml_files), xmlfile))
-        self.parse_jsidl_file(xmlfile)
-      logging.info("%d message types found" % self._message_count)
-      if self._message_failed:
-        logging.warning("Parse errors in %d message types: \n\t%s" % (len(self._message_failed), '\n\t'.join(["%s: %s" % (msgname, fname) for msgname, fname in self._message_failed])))
-      if self._message_doubles:
-        logging.warning("Skipped %d message types, their name was already been parsed. See warnings for details!" % (len(self._message_doubles)))
-      logging.info("Wireshark plugin was written to: %s" % (output_path))
+      failed = []
+      for xml_file in sorted(affected & self.xml_files):
+        logging.debug("Parse again: %s" % xml_file)
+        try:
+          self.parse_jsidl_file(xml_file)
+        except Exception:
+          import traceback
+          logging.warning(traceback.format_exc())
+          failed.append(xml_file)
+      if failed:
+        # keep the last plugin, the files are parsed again on their next change
+        self._restore_state(state)
+        logging.warning("Can not parse %s, %s was not changed" % (', '.join(failed), self.output_path))
+        return None
+      # in a full parse the first file in sorted order gets the message ID, parse the files with these IDs again
+      owners = set()
+      for msg_id, files in self._skipped_ids.items():
+        owner = self._message_ids.get(msg_id)
+        if owner is not None and owner not in affected and [xml_file for xml_file in files if xml_file < owner]:
+          owners.add(owner)
+      if not owners:
+        break
+      affected |= owners
+    self.write_lua()
+    if self.catalog_path:
+      self.write_catalog()
+    self._log_errors()
+    return affected
+
+  def _add_affected_files(self, affected):
+    # adds all files referencing the affected files and the files with skipped messages of their message IDs
+    queue = list(affected)
+    while queue:
+      xml_file = queue.pop()
+      files = set([dep_file for dep_file, deps in self._file_deps.items() if xml_file in deps])
+      for msg_id, owner in self._message_ids.items():
+        if owner == xml_file:
+          files |= self._skipped_ids.get(msg_id, set())
+      files -= affected
+      affected |= files
+      queue.extend(files)
+
+  def _remove_file_results(self, xml_files):
+    # releases the message IDs and removes the generated code of the files
+    for msg_id, xml_file in list(self._message_ids.items()):
+      if xml_file in xml_files:
+        del self._message_ids[msg_id]
+    for msg_id in list(self._skipped_ids):
+      self._skipped_ids[msg_id] -= xml_files
+      if not self._skipped_ids[msg_id]:
+        del self._skipped_ids[msg_id]
+    for key in [key for key in self._const_values if key[1] in xml_files]:
+      del self._const_values[key]
+    for xml_file in xml_files:
+      self._const_tables.pop(xml_file, None)
+      self._file_messages.pop(xml_file, None)
+      self._file_deps.pop(xml_file, None)
+      self._catalog_entries.pop(xml_file, None)
+      self._file_sets.pop(xml_file, None)
+
+  def _copy_state(self):
+    # results of all files, restored by _restore_state() if an update fails
+    state = {}
+    for attr in ('xml_files', '_xml_file_refs', '_const_tables', '_const_values', '_file_messages', '_file_deps', '_catalog_entries', '_file_sets',
+                 '_message_ids', '_message_count', '_message_failed', '_message_doubles'):
+      state[attr] = copy.copy(getattr(self, attr))
+    for attr in ('_xml_file_ids', '_skipped_ids'):
+      state[attr] = dict([(key, copy.copy(value)) for key, value in getattr(self, attr).items()])
+    return state
+
+  def _restore_state(self, state):
+    for attr, value in state.items():
+      setattr(self, attr, value)
+
+  def watch(self, interval=0.5):
+    '''
+    Stays resident and updates the Lua plugin on changes of JSIDL files in the input path.
+    Uses inotify if `inotify_simple` is installed, otherwise polls the files every `interval` seconds.
+    '''
+    # keep all parsed documents in memory
+    self.DOC_CACHE_SIZE = max(self.DOC_CACHE_SIZE, 2 * len(self.xml_files))
+    inotify = None
+    try:
+      from inotify_simple import INotify, flags
+      inotify = INotify()
+      watch_flags = flags.CREATE | flags.CLOSE_WRITE | flags.DELETE | flags.MOVED_TO | flags.MOVED_FROM
+    except ImportError:
+      logging.info("inotify_simple not found, poll for changes every %.1f sec" % interval)
+    logging.info("Watch for changes in %s, stop with Ctrl+C" % self.input_path)
+    stats = self._stat_xml_files()
+    # directory: watch descriptor, new directories are added after each event
+    watched = {}
+    rescan = True
+    while True:
+      if inotify is not None:
+        if rescan:
+          for root, _dirnames, _filenames in os.walk(self.input_path):
+            if root not in watched:
+              try:
+                watched[root] = inotify.add_watch(root, watch_flags)
+              except OSError:
+                # removed in the meantime
+                pass
+        events = inotify.read(timeout=int(interval * 1000))
+        rescan = bool(events)
+        if not events:
+          continue
+        # editors create more than one event on save
+        time.sleep(0.05)
+        events += inotify.read(timeout=0)
+        # the watch of a removed directory is removed by the kernel
+        removed = set([event.wd for event in events if event.mask & flags.IGNORED])
+        watched = dict([(root, wd) for root, wd in watched.items() if wd not in removed])
+      else:
+        time.sleep(interval)
+      new_stats = self._stat_xml_files()
+      changed = set([xml_file for xml_file in set(stats) | set(new_stats) if stats.get(xml_file) != new_stats.get(xml_file)])
+      stats = new_stats
+      if changed:
+        start = time.time()
+        affected = self.update(changed)
+        if affected is not None:
+          logging.info("%d changed files, parsed %d files again, written in %.3f sec to %s" % (len(changed), len(affected), time.time() - start, self.output_path))
+
+  def _stat_xml_files(self):
+    # modification time and size of all xml files to detect changes
+    result = {}
+    for xml_file in self._find_xml_files():
+      try:
+        st = os.stat(xml_file)
+        result[xml_file] = (st.st_mtime_ns, st.st_size)
+      except OSError:
+        pass
+    return result
 
   def parse_jsidl_file(self, filename):
     js = self._get_doc(filename)
     self.dirname = os.path.dirname(filename)
     logging.debug("current directory: %s" % self.dirname)
+    self._file_messages[filename] = []
+    self._file_deps[filename] = self._referenced_files(js)
+    self._catalog_entries[filename] = []
+    # name, id and version of the set containing the messages
+    self._current_set = tuple([None if getattr(js, attr, None) is None else str(getattr(js, attr)) for attr in ('name', 'id', 'version')])
+    set_name, set_id, set_version = self._current_set
+    # different versions of a set can be loaded, e.g. without --exclude, each gets its own preference
+    set_label = set_id or set_name or 'unknown'
+    if set_version:
+      set_label = '%s v%s' % (set_label, set_version)
+    self._file_sets[filename] = ('set_%s' % re.sub(r'[^a-z0-9_]', '_', set_label.lower()), set_label)
     found_message_def = False
     if hasattr(js, 'message_def'):
       found_message_def = True
@@ -157,49 +460,131 @@ class Parse_JSIDL:
         if jsmsg.message_id in self._message_ids:
           self._message_doubles.append("%s(%s)" % (jsmsg.name, msg_id_hex))
           logging.warning("skip message with already parsed message ID: %s, msg_id: %s,\n  file: %s,\n  first found in %s" %(jsmsg.name, msg_id_hex, filename, self._message_ids[jsmsg.message_id]))
+          self._skipped_ids.setdefault(jsmsg.message_id, set()).add(filename)
           continue
         self._not_parsed = []
         self._current_msg_name = jsmsg.name
         self._message_ids[jsmsg.message_id] = filename
         logging.debug("Parse message: %s, msg_id: %s" %(jsmsg.name, msg_id_hex))
         self._message_count += 1
-        
-
-        self.data_string = LINE('%s = Proto("%s", "%s 0x%s")' % (dissector_name, dissector_name, jsmsg.name, msg_id_hex), 0)
-        self.data_string += LINE("function %s.dissector(buffer, pinfo, tree)" % dissector_name, 0)
-        self.data_string += LINE("-- %s" % filename, 1)
-        self.data_string += LINE("local bufidx = 0", 1)
-        self.data_string += LINE("messageid = buffer(bufidx, 2):le_uint()", 1)
-        self.data_string += LINE('local tree_msg = tree:add(pf_message_name, buffer(), "%s", string.format("%s, MessageID: %%04X, %%d bytes", messageid, buffer:len()))' % (jsmsg.name, jsmsg.name), 1)
+        self._size_cache = {}
+        self._in_guarded_segment = False
+        self._offset = 0
+        self._folding = False
+
+        self.lua_lines = [LINE('%s = Proto("%s", "%s 0x%s")' % (dissector_name, dissector_name, jsmsg.name, msg_id_hex), 0)]
+        self.lua_lines.append(LINE("function %s.dissector(buffer, pinfo, tree)" % dissector_name, 0))
+        self.lua_lines.append(LINE("-- %s" % filename, 1))
+        # skip decoding if the set of this message is disabled in preferences
+        self.lua_lines.append(LINE('if not set_enabled["%s"] then' % self._file_sets[filename][0], 1))
+        self.lua_lines.append(LINE('tree:add(pf_message_name, buffer(), "%s", "%s, not decoded (disabled in preferences)")' % (jsmsg.name, jsmsg.name), 2))
+        self.lua_lines.append(LINE('pinfo.cols.info:set(string.format("%%s %%s", tostring(pinfo.cols.info), "%s"))' % jsmsg.name, 2))
+        self.lua_lines.append(LINE("return", 2))
+        self.lua_lines.append(LINE("end", 1))
+        self.lua_lines.append(LINE("local bufidx = 0", 1))
+        self.lua_lines.append(LINE("local fieldbuf", 1))
+        self.lua_lines.append(LINE("messageid = buffer(bufidx, 2):le_uint()", 1))
+        self.lua_lines.append(LINE('local tree_msg = tree:add(pf_message_name, buffer(), "%s", string.format("%s, MessageID: %%04X, %%d bytes", messageid, buffer:len()))' % (jsmsg.name, jsmsg.name), 1))
         # update column info
-        self.data_string += LINE('pinfo.cols.info:set(string.format("%%s %%s", tostring(pinfo.cols.info), "%s"))' % jsmsg.name, 1)
+        self.lua_lines.append(LINE('pinfo.cols.info:set(string.format("%%s %%s", tostring(pinfo.cols.info), "%s"))' % jsmsg.name, 1))
+        # report short messages. This check is advisory only and continues the dissection to show the fields
+        # in front of the truncation, the decoding stops at the first segment not fully contained in the buffer
+        min_size = sum([self._element_size(rc, infile)[0] for rc, infile in self._header_elements(jsmsg, filename)])
+        min_size += sum([self._element_size(bc, filename)[0] for bc in jsmsg.body.orderedContent()])
+        self.lua_lines.append(LINE("if buffer:len() < %d then" % min_size, 1))
+        self.lua_lines.append(LINE('tree_msg:add_expert_info(PI_MALFORMED, PI_WARN, "Message shorter than its minimal size of %d bytes")' % min_size, 2))
+        self.lua_lines.append(LINE("end", 1))
         # add header
-        self.data_string += self.find_header(jsmsg, filename)
+        self.lua_lines += self.find_header(jsmsg, filename)
         # add body
         if jsmsg.body.orderedContent():
-          self.data_string += LINE('local body_tree = tree_msg:add(buffer(bufidx, buffer:len() - bufidx), "Body")', 1)
-          for bc in jsmsg.body.orderedContent():
-            self.data_string += self.parse_element(bc, "body", filename)
+          self.lua_lines.append(LINE('local body_tree = tree_msg:add(buffer(bufidx, buffer:len() - bufidx), "Body")', 1))
+          self.lua_lines += self._parse_elements(jsmsg.body.orderedContent(), "body", filename)
         if self._not_parsed:
-          self.data_string += LINE('local not_parsed_tree = tree_msg:add_expert_info(PI_UNDECODED, PI_WARN, "this message contains fields not included into this dissector %s. Field values could be wrong!")' % str(self._not_parsed), 1)
+          self.lua_lines.append(LINE('local not_parsed_tree = tree_msg:add_expert_info(PI_UNDECODED, PI_WARN, "this message contains fields not included into this dissector %s. Field values could be wrong!")' % str(self._not_parsed), 1))
         # close dissector
-        self.data_string += LINE("end", 0)
-        self.data_string += LINE("messagetable:add(0x%s, %s)\n" % (msg_id_hex.upper(), dissector_name), 0)
-        # write into the file only if no Exception occurs
-        self.lua_file.write(self.data_string)
+        self.lua_lines.append(LINE("end", 0))
+        self.lua_lines.append(LINE("messagetable:add(0x%s, %s)\n" % (msg_id_hex.upper(), dissector_name), 0))
+        # add to the plugin only if no Exception occurs, joined to one string to keep the fragments of all files small
+        self._file_messages[filename].append(''.join(self.lua_lines))
+        if self.catalog_path:
+          self._add_catalog_entry(jsmsg, int(msg_id_hex, 16), filename)
       except Exception:
         import traceback
         logging.warning(traceback.format_exc())
         self._message_failed.append((jsmsg.name, filename))
 
+  def _add_catalog_entry(self, jsmsg, msg_id, filename):
+    from fkie_iop_wireshark_plugin.message_catalog import CatalogMessage
+    fields = []
+    try:
+      self._catalog_fields(jsmsg, filename, '', fields)
+    except Exception as err:
+      # a partial layout can not be told apart from a complete one, store none
+      fields = []
+      logging.warning("Field layout of %s not added to catalog: %s, file: %s" % (jsmsg.name, err, filename))
+    msg = CatalogMessage(msg_id, str(jsmsg.name), filename, *self._current_set)
+    self._catalog_entries[filename].append((msg, fields))
+
+  def _catalog_fields(self, element, filename, path, fields):
+    # adds all fields of the element in layout order, declared types are resolved
+    from fkie_iop_wireshark_plugin.message_catalog import CatalogField
+    for rc in element.orderedContent():
+      if not hasattr(rc, 'elementDeclaration'):
+        continue
+      kind = rc.elementDeclaration.name().localName()
+      if kind in self.CATALOG_SKIPPED_ELEMENTS:
+        continue
+      value = rc.value
+      infile = filename
+      name = getattr(value, 'name', None)
+      optional = str(getattr(value, 'optional', 'false')) == 'true'
+      if kind.startswith('declared_') and getattr(value, 'declared_type_ref', None):
+        kind = kind[len('declared_'):]
+        js, infile = self._resolve_type_ref(value.declared_type_ref, kind, filename)
+        value = js.value
+      field_path = '.'.join([p for p in (path, name) if p])
+      field_type = getattr(value, 'field_type', None) or getattr(value, 'field_type_unsigned', None)
+      size = None
+      scale_factor = scale_bias = None
+      if field_type is not None:
+        field_type = str(field_type)
+        size = self.get_field_type_length(field_type)
+      if kind == 'fixed_length_string':
+        size = self._to_int(value.string_length, infile)
+      elif kind == 'dimension':
+        size = self._to_int(value.size, infile)
+      elif kind == 'fixed_field':
+        for valset in value.orderedContent():
+          if valset.elementDeclaration.name().localName() == "scale_range":
+            scale_factor, scale_bias = self.parse_scale_range(valset, size, '', infile, 0)
+      fields.append(CatalogField(field_path, kind, field_type, size, optional, scale_factor, scale_bias))
+      # only complex types with child elements
+      if getattr(value, '_ContentTypeTag', None) in (getattr(value, '_CT_ELEMENT_ONLY', None), getattr(value, '_CT_MIXED', None)):
+        self._catalog_fields(value, infile, field_path, fields)
+
   def parse_element(self, element, lua_var_prefix, filename, depth=1, list_index_str=''):
-    result_str = ""
+    result_str = []
     # check for optional parameter and add an if-statement if it is  true
     optional = hasattr(element.value, "optional") and str(element.value.optional) == "true"
+    elname = element.elementDeclaration.name().localName()
+    folding = self._folding
+    # records with static size continue the run of the enclosing elements
+    static_record = folding and elname in ['record', 'sequence', 'declared_record'] and self._element_size(element, filename)[1] is not None
+    if optional or not (elname in self.FOLDED_ELEMENTS or static_record):
+      # the following code depends on bufidx
+      result_str += self._flush_offset(depth)
+      self._folding = False
     if optional:
-      result_str += LINE('if (bitAND(%s_pv, %s_pv_count) > 0) then' % (lua_var_prefix, lua_var_prefix), depth)
+      result_str.append(LINE('if (bitAND(%s_pv, %s_pv_count) > 0) then' % (lua_var_prefix, lua_var_prefix), depth))
       depth += 1
-    elname = element.elementDeclaration.name().localName()
+    guarded = self._in_guarded_segment
+    if optional and not guarded:
+      # optional elements are not part of a segment, check them inside the if-statement
+      min_size, size = self._element_size(element, filename, ignore_optional=True)
+      if min_size:
+        result_str += self._length_check(min_size, self._element_label(element), depth)
+      self._in_guarded_segment = size is not None
     if elname == "array":
       result_str += self.parse_array(element, lua_var_prefix, filename, depth)
     elif elname == "bit_field":
@@ -239,13 +624,17 @@ class Parse_JSIDL:
     else:
       logging.info("skipped '%s' -- no parser implemented, message: %s, file: %s" % (elname, self._current_msg_name, filename))
       self._not_parsed.append(elname)
+    self._in_guarded_segment = guarded
+    if not self._folding:
+      result_str += self._flush_offset(depth)
+    self._folding = folding
     if optional:
-      result_str += LINE("end", depth - 1)
-      result_str += LINE('%s_pv_count = %s_pv_count + 1' % (lua_var_prefix, lua_var_prefix), depth - 1)
+      result_str.append(LINE("end", depth - 1))
+      result_str.append(LINE('%s_pv_count = %s_pv_count + 1' % (lua_var_prefix, lua_var_prefix), depth - 1))
     return result_str
 
   def parse_array(self, element, lua_var_prefix, filename, depth=1, declared_name='', declared_comment=''):
-    result = ""
+    result = []
     name = self.get_name(element, force=declared_name)
     comment = self.get_comment(element, force=declared_comment)
     # parse dimensions
@@ -259,25 +648,24 @@ class Parse_JSIDL:
         dim_name = rc.value.name
         dimension = (dim_name, size, dim_comment, dimension)
     string_prefix = "%s_%s" % (lua_var_prefix, element.value.name)
-    result += LINE('local %s_tree = %s_tree:add("%s%s")' % (string_prefix, lua_var_prefix, name, comment), depth)
+    result.append(LINE('local %s_tree = %s_tree:add("%s%s")' % (string_prefix, lua_var_prefix, name, comment), depth))
     result += self._parse_array_wo_dimension(element, dimension, string_prefix, filename, depth + 1)
     return result
 
   def _parse_array_wo_dimension(self, element, dimension, lua_var_prefix, filename, depth=1):
     dim_prefix_str = "%s_%s" % (lua_var_prefix, dimension[0])
-    result = ''
-    result += LINE('local %s_tree = %s_tree:add("%s [%d]%s")' % (dim_prefix_str, lua_var_prefix, dimension[0], dimension[1], dimension[2]), depth)
-    result += LINE('for %s_i = 1, %d do' % (dim_prefix_str, dimension[1]), depth)
+    result = []
+    result.append(LINE('local %s_tree = %s_tree:add("%s [%d]%s")' % (dim_prefix_str, lua_var_prefix, dimension[0], dimension[1], dimension[2]), depth))
+    result.append(LINE('for %s_i = 1, %d do' % (dim_prefix_str, dimension[1]), depth))
     if dimension[3]:
       result += self._parse_array_wo_dimension(element, dimension[3], dim_prefix_str, filename, depth + 1)
-    for rc in element.value.orderedContent():
-      if rc.elementDeclaration.name().localName() != "dimension":
-        result += self.parse_element(rc, dim_prefix_str, filename, depth + 1)
-    result += LINE('end', depth)
+    elements = [rc for rc in element.value.orderedContent() if rc.elementDeclaration.name().localName() != "dimension"]
+    result += self._parse_elements(elements, dim_prefix_str, filename, depth + 1)
+    result.append(LINE('end', depth))
     return result
 
   def parse_record(self, element, lua_var_prefix, filename, depth=1, declared_name='', declared_comment='', list_index_str=''):
-    result = ""
+    result = []
     name = self.get_name(element, force=declared_name)
     comment = self.get_comment(element, force=declared_comment)
     string_prefix = lua_var_prefix
@@ -286,40 +674,175 @@ class Parse_JSIDL:
       string_prefix = "%s_%s" % (lua_var_prefix, name)
       if list_index_str:
         # add list index to the name
-        result += LINE('local %s_tree = %s_tree:add(string.format("%s_%%d%s", %s))' % (string_prefix, lua_var_prefix, name, comment, list_index_str), depth)
+        result.append(LINE('local %s_tree = %s_tree:add(string.format("%s_%%d%s", %s))' % (string_prefix, lua_var_prefix, name, comment, list_index_str), depth))
       else:
-        result += LINE('local %s_tree = %s_tree:add("%s%s")' % (string_prefix, lua_var_prefix, name, comment), depth)
-    for rc in element.value.orderedContent():
-      result += self.parse_element(rc, string_prefix, filename, depth)
+        result.append(LINE('local %s_tree = %s_tree:add("%s%s")' % (string_prefix, lua_var_prefix, name, comment), depth))
+    result += self._parse_elements(element.value.orderedContent(), string_prefix, filename, depth)
+    return result
+
+  def _parse_elements(self, elements, lua_var_prefix, filename, depth=1):
+    # parses consecutive elements, each fixed-layout segment is preceded by one length check
+    result = []
+    guarded = self._in_guarded_segment
+    folding = self._folding
+    self._folding = True
+    segment_end = 0
+    for idx, rc in enumerate(elements):
+      if not guarded and idx >= segment_end:
+        size, segment_end = self._segment_size(elements, idx, filename)
+        if size:
+          result += self._flush_offset(depth)
+          label = self._element_label(elements[idx])
+          if segment_end - idx > 1:
+            label = "%s..%s" % (label, self._element_label(elements[segment_end - 1]))
+          result += self._length_check(size, label, depth)
+      # the last element of a segment may have a variable size, only its leading count or vtag field is checked
+      self._in_guarded_segment = guarded or self._element_size(rc, filename)[1] is not None
+      result += self.parse_element(rc, lua_var_prefix, filename, depth)
+    if not folding:
+      result += self._flush_offset(depth)
+    self._in_guarded_segment = guarded
+    self._folding = folding
+    return result
+
+  def _bufidx(self):
+    # index of the next field, the offset of folded fields is added to bufidx later
+    if self._offset:
+      return "bufidx + %d" % self._offset
+    return "bufidx"
+
+  def _flush_offset(self, depth):
+    # adds the offset of folded fields to bufidx
+    result = []
+    if self._offset:
+      result.append(LINE("bufidx = bufidx + %d" % self._offset, depth))
+      self._offset = 0
+    return result
+
+  def _segment_size(self, elements, start, filename):
+    '''
+    Returns the size of the fixed-layout segment beginning with elements[start] and the index after its last element.
+    A segment ends with an element of variable size (including its leading count or vtag field) or before an
+    optional element or record and array of variable size. These are checked by their own segments.
+    '''
+    size = 0
+    for idx in range(start, len(elements)):
+      if self._is_optional(elements[idx]):
+        return size, max(idx, start + 1)
+      min_size, static_size = self._element_size(elements[idx], filename)
+      if static_size is None:
+        if elements[idx].elementDeclaration.name().localName() in self.CONTAINER_ELEMENTS:
+          return size, max(idx, start + 1)
+        return size + min_size, idx + 1
+      size += min_size
+    return size, len(elements)
+
+  def _element_size(self, element, filename, ignore_optional=False):
+    '''
+    Returns a tuple (minimal size, static size) in bytes. The static size is None, if the size depends on the
+    content, e.g. for lists, strings with variable length or optional elements.
+    '''
+    key = (id(element), ignore_optional)
+    try:
+      # the element is stored with its size, so its id is not reused by another element while it is cached
+      cached_element, result = self._size_cache[key]
+      if cached_element is element:
+        return result
+    except KeyError:
+      pass
+    value = element.value
+    elname = element.elementDeclaration.name().localName()
+    min_size = 0
+    size = None
+    if elname.startswith('declared_') and getattr(value, 'declared_type_ref', None):
+      try:
+        js, infile = self._resolve_type_ref(value.declared_type_ref, elname[len('declared_'):], filename)
+        min_size, size = self._element_size(js, infile, ignore_optional=True)
+      except Exception as err:
+        # handled like an element with variable size, errors are reported when the element is parsed
+        logging.debug("size of %s not resolved: %s, message: %s, file: %s" % (elname, err, self._current_msg_name, filename))
+        min_size, size = 0, None
+    elif elname == "fixed_field":
+      size = self.get_field_type_length(value.field_type)
+    elif elname in ["bit_field", "presence_vector"]:
+      size = self.get_field_type_length(value.field_type_unsigned)
+    elif elname == "fixed_length_string":
+      size = self._to_int(value.string_length, filename)
+    elif elname in ["record", "sequence"]:
+      size = 0
+      for rc in value.orderedContent():
+        rc_min, rc_size = self._element_size(rc, filename)
+        min_size += rc_min
+        size = None if size is None or rc_size is None else size + rc_size
+    elif elname == "array":
+      count = 1
+      size = 0
+      for rc in value.orderedContent():
+        if rc.elementDeclaration.name().localName() == "dimension":
+          if hasattr(rc.value, "size"):
+            count *= self._to_int(rc.value.size, filename)
+        else:
+          rc_min, rc_size = self._element_size(rc, filename)
+          min_size += rc_min
+          size = None if size is None or rc_size is None else size + rc_size
+      min_size *= count
+      if size is not None:
+        size *= count
+    elif elname in ["list", "variable_length_string", "variable_length_field", "variant"]:
+      # only the leading count or vtag field
+      min_size = self.get_field_type_length(value.orderedContent()[0].value.field_type_unsigned)
+    elif elname == "variable_format_field":
+      min_size = 1 + self.get_field_type_length(value.orderedContent()[1].value.field_type_unsigned)
+    elif elname == "variable_field":
+      min_size = 1
+    if size is not None:
+      min_size = size
+    if not ignore_optional and self._is_optional(element):
+      min_size, size = 0, None
+    self._size_cache[key] = (element, (min_size, size))
+    return min_size, size
+
+  def _is_optional(self, element):
+    return hasattr(element.value, "optional") and str(element.value.optional) == "true"
+
+  def _element_label(self, element):
+    return getattr(element.value, 'name', None) or element.elementDeclaration.name().localName()
+
+  def _length_check(self, size, label, depth):
+    # stops the dissection with an expert info if less than `size` (number or Lua expression) bytes are left
+    result = [LINE("if buffer:len() - bufidx < %s then" % size, depth)]
+    result.append(LINE('tree_msg:add_expert_info(PI_MALFORMED, PI_ERROR, string.format("Truncated message: %%d bytes expected for %s, %%d left", %s, buffer:len() - bufidx))' % (label, size), depth + 1))
+    result.append(LINE("return", depth + 1))
+    result.append(LINE("end", depth))
     return result
 
   def parse_variant(self, element, lua_var_prefix, filename, depth=1, list_index_str=''):
-    result = ""
+    result = []
     name = self.get_name(element)
     comment = self.get_comment(element)
     string_prefix = "%s_%s" % (lua_var_prefix, name)
     if list_index_str:
       # add list index to the name
-      result += LINE('local %s_tree = %s_tree:add(string.format("%s_%%d%s", %s))' % (string_prefix, lua_var_prefix, name, comment, list_index_str), depth)
+      result.append(LINE('local %s_tree = %s_tree:add(string.format("%s_%%d%s", %s))' % (string_prefix, lua_var_prefix, name, comment, list_index_str), depth))
     else:
-      result += LINE('local %s_tree = %s_tree:add("%s%s")' % (string_prefix, lua_var_prefix, name, comment), depth)
+      result.append(LINE('local %s_tree = %s_tree:add("%s%s")' % (string_prefix, lua_var_prefix, name, comment), depth))
     vtag_field = element.value.orderedContent()[0]
     if vtag_field.elementDeclaration.name().localName() != "vtag_field":
       raise Exception("Variant should contain vtag_field!")
     vtag_str, data_string, type_len = self.parse_vtag_field(vtag_field, string_prefix, filename, depth)
     result += data_string
-    result += LINE('local %s_index = %s' % (lua_var_prefix, vtag_str), depth)
-    result += LINE("bufidx = bufidx + %d" % type_len, depth)
+    result.append(LINE('local %s_index = %s' % (lua_var_prefix, vtag_str), depth))
+    result.append(LINE("bufidx = bufidx + %d" % type_len, depth))
     var_counter = 0
     for rc in element.value.orderedContent()[1:]:
-      result += LINE('if (%s_index == %s) then' % (lua_var_prefix, var_counter), depth)
+      result.append(LINE('if (%s_index == %s) then' % (lua_var_prefix, var_counter), depth))
       result += self.parse_element(rc, string_prefix, filename, depth + 1)
-      result += LINE("end", depth)
+      result.append(LINE("end", depth))
       var_counter += 1
     return result
   
   def parse_variable_format_field(self, element, lua_var_prefix, filename , depth=1):
-    result = ""
+    result = []
     q_list = ""
     name = self.get_name(element)
     variable_format_field = element.value.orderedContent()[0]
@@ -333,23 +856,24 @@ class Parse_JSIDL:
     string_prefix = "%s_%s" % (lua_var_prefix, element.value.name)
     count_str, data_string, count_type_len = self.parse_count_field(count_field, lua_var_prefix, filename, depth)
     buffer_str = "buffer(bufidx, %d)" % (count_type_len)
-    result += LINE("local format_field_set = {%s}" % q_list, depth)
-    result += LINE("local format_field_value = buffer(bufidx, 1):le_uint()", depth)
-    result += LINE("bufidx = bufidx + 1", depth)
-    result += LINE('%s_tree:add(%s, string.format("%s: %%s [%%s] -- (%%d)",format_field_value, format_field_set[format_field_value], buffer(bufidx, 2):le_uint()))' % (lua_var_prefix, buffer_str, name), depth)
-
-    result += LINE('local %s_count = %s' % (lua_var_prefix, count_str), depth)
-    result += LINE("bufidx = bufidx + %d" % (count_type_len), depth)
-    result += LINE('submsgid = buffer(bufidx, 2):le_uint()', depth)
-    result += LINE('local subpacket_dissector = messagetable:get_dissector(submsgid)', depth)
-    result += LINE('if subpacket_dissector ~= nil then', depth)
-    result += LINE('subid_str = subpacket_dissector(buffer(bufidx, %s_count):tvb(), pinfo, tree)' % (lua_var_prefix), depth + 1)
-    result += LINE('else', depth)
-
-    result += LINE('local %s_tree = %s_tree:add(pf_sub_messageid, buffer(bufidx, 2), submsgid, string.format("Included Message, MessageID: 0x%%04X, %%d bytes", submsgid, %s_count))' % (string_prefix, lua_var_prefix, lua_var_prefix), depth)
-    result += LINE('%s_tree:append_text(", unknown message")' % string_prefix, depth + 1)
-    result += LINE('end', depth)
-    result += LINE("bufidx = bufidx + %s_count" % (lua_var_prefix), depth)
+    result.append(LINE("local format_field_set = {%s}" % q_list, depth))
+    result.append(LINE("local format_field_value = buffer(bufidx, 1):le_uint()", depth))
+    result.append(LINE("bufidx = bufidx + 1", depth))
+    result.append(LINE('%s_tree:add(%s, string.format("%s: %%s [%%s] -- (%%d)",format_field_value, format_field_set[format_field_value], buffer(bufidx, 2):le_uint()))' % (lua_var_prefix, buffer_str, name), depth))
+
+    result.append(LINE('local %s_count = %s' % (lua_var_prefix, count_str), depth))
+    result.append(LINE("bufidx = bufidx + %d" % (count_type_len), depth))
+    result += self._length_check("math.max(%s_count, 2)" % lua_var_prefix, name, depth)
+    result.append(LINE('submsgid = buffer(bufidx, 2):le_uint()', depth))
+    result.append(LINE('local subpacket_dissector = messagetable:get_dissector(submsgid)', depth))
+    result.append(LINE('if subpacket_dissector ~= nil then', depth))
+    result.append(LINE('subid_str = subpacket_dissector(buffer(bufidx, %s_count):tvb(), pinfo, tree)' % (lua_var_prefix), depth + 1))
+    result.append(LINE('else', depth))
+
+    result.append(LINE('local %s_tree = %s_tree:add(pf_sub_messageid, buffer(bufidx, 2), submsgid, string.format("Included Message, MessageID: 0x%%04X, %%d bytes", submsgid, %s_count))' % (string_prefix, lua_var_prefix, lua_var_prefix), depth))
+    result.append(LINE('%s_tree:append_text(", unknown message")' % string_prefix, depth + 1))
+    result.append(LINE('end', depth))
+    result.append(LINE("bufidx = bufidx + %s_count" % (lua_var_prefix), depth))
     return result
   
   def parse_vtag_field(self, element, lua_var_prefix, filename, depth=1):
@@ -357,18 +881,17 @@ class Parse_JSIDL:
     min_count = element.value.min_count
     max_count = element.value.max_count
     vtag_str = "buffer(bufidx, %d):le_uint()" % (field_type_unsigned)
-    data_str = LINE('%s_tree:add(buffer(bufidx, %d), string.format("vtag: %%d, min_count: %s, max_count: %s", %s))' % (lua_var_prefix, field_type_unsigned, str(min_count), str(max_count), vtag_str), depth)
+    data_str = [LINE('%s_tree:add(buffer(bufidx, %d), string.format("vtag: %%d, min_count: %s, max_count: %s", %s))' % (lua_var_prefix, field_type_unsigned, str(min_count), str(max_count), vtag_str), depth)]
     return vtag_str, data_str, field_type_unsigned
 
   def parse_bit_field(self, element, lua_var_prefix, filename, depth=1, declared_name='', declared_comment=''):
-    result = ""
+    result = []
     name = self.get_name(element, force=declared_name)
     q_type_length = self.get_field_type_length(element.value.field_type_unsigned)
     comment = self.get_comment(element, "(%s)" % element.value.field_type_unsigned, force=declared_comment)
     string_prefix = "%s_%s" % (lua_var_prefix, element.value.name)
-    buffer_str = "buffer(bufidx, %d)" % (q_type_length)
-    result += LINE('local %s_buf = %s' % (string_prefix, buffer_str), depth)
-    result += LINE('local %s_tree = %s_tree:add(%s, string.format("%%s = %s: 0x%%X %s", bitstr(%s_buf:le_uint(), %d), %s_buf:le_uint()))' % (string_prefix, lua_var_prefix, buffer_str, name, comment, string_prefix, q_type_length * 8, string_prefix), depth)
+    result.append(LINE('fieldbuf = buffer(%s, %d)' % (self._bufidx(), q_type_length), depth))
+    result.append(LINE('local %s_tree = %s_tree:add(fieldbuf, string.format("%%s = %s: 0x%%X %s", bitstr(fieldbuf:le_uint(), %d), fieldbuf:le_uint()))' % (string_prefix, lua_var_prefix, name, comment, q_type_length * 8), depth))
     # parse subfields
     for rc in element.value.orderedContent():
       if rc.elementDeclaration.name().localName() == "sub_field":
@@ -377,26 +900,27 @@ class Parse_JSIDL:
         if hasattr(rc.value, "bit_range"):
           from_index = rc.value.bit_range.from_index
           to_index = rc.value.bit_range.to_index
-          result += LINE('%s_tree:add(%s, string.format("%%s = %s: %%d", bitstr_part(%s_buf:le_uint(), %d, %s, %s), bitVal(%s_buf:le_uint(), %s, %s)))' % (string_prefix, buffer_str, rc.value.name, string_prefix, q_type_length * 8, from_index, to_index, string_prefix, from_index, to_index), depth)
+          result.append(LINE('%s_tree:add(fieldbuf, string.format("%%s = %s: %%d", bitstr_part(fieldbuf:le_uint(), %d, %s, %s), bitVal(fieldbuf:le_uint(), %s, %s)))' % (string_prefix, rc.value.name, q_type_length * 8, from_index, to_index, from_index, to_index), depth))
         else:
           logging.warning("no 'bit_range' in 'sub_field' found, message: %s, file: %s" % (self._current_msg_name, filename))
-    result += LINE("bufidx = bufidx + %d" % q_type_length, depth)
+    self._offset += q_type_length
     return result
 
   def parse_fixed_length_string(self, element, lua_var_prefix, filename, depth=1, declared_name='', declared_comment=''):
-    result = ""
+    result = []
     name = self.get_name(element, force=declared_name)
     # read string_length first
     if hasattr(element.value, "string_length"):
       string_length = self._to_int(element.value.string_length, filename)
-      result += LINE('%s_tree:add(buffer(bufidx, %d), string.format("%s [%d]: %%s", buffer(bufidx, %d):string()))' % (lua_var_prefix, string_length, name, string_length, string_length), depth)
-      result += LINE("bufidx = bufidx + %d" % (string_length), depth)
+      result.append(LINE('fieldbuf = buffer(%s, %d)' % (self._bufidx(), string_length), depth))
+      result.append(LINE('%s_tree:add(fieldbuf, string.format("%s [%d]: %%s", fieldbuf:string()))' % (lua_var_prefix, name, string_length), depth))
+      self._offset += string_length
     else:
       logging.warning("no 'string_length' in 'fixed_length_string' found, message: %s, file: %s" % (self._current_msg_name, filename))
     return result
 
   def parse_variable_length_field(self, element, lua_var_prefix, filename, depth=1):
-    result = ""
+    result = []
     if element.value.field_format == "JAUS MESSAGE":
       # read count field first
       count_field = element.value.orderedContent()[0]
@@ -405,21 +929,22 @@ class Parse_JSIDL:
       string_prefix = "%s_%s" % (lua_var_prefix, element.value.name)
       count_str, data_string, count_type_len = self.parse_count_field(count_field, lua_var_prefix, filename, depth)
       result += data_string
-      result += LINE('local %s_count = %s' % (lua_var_prefix, count_str), depth)
-      result += LINE("bufidx = bufidx + %d" % (count_type_len), depth)
-      result += LINE('if %s_count > buffer:len() - bufidx then' % (lua_var_prefix), depth)
-      result += LINE('%s_count = buffer:len() - bufidx' % (lua_var_prefix), depth + 1)
-      result += LINE('end', depth)
-      result += LINE('submsgid = buffer(bufidx, 2):le_uint()', depth)
-      result += LINE('local subpacket_dissector = messagetable:get_dissector(submsgid)', depth)
-      result += LINE('if subpacket_dissector ~= nil then', depth)
-      result += LINE('subid_str = subpacket_dissector(buffer(bufidx, %s_count):tvb(), pinfo, tree)' % (lua_var_prefix), depth + 1)
-      result += LINE('else', depth)
+      result.append(LINE('local %s_count = %s' % (lua_var_prefix, count_str), depth))
+      result.append(LINE("bufidx = bufidx + %d" % (count_type_len), depth))
+      result.append(LINE('if %s_count > buffer:len() - bufidx then' % (lua_var_prefix), depth))
+      result.append(LINE('%s_count = buffer:len() - bufidx' % (lua_var_prefix), depth + 1))
+      result.append(LINE('end', depth))
+      result += self._length_check(2, element.value.name, depth)
+      result.append(LINE('submsgid = buffer(bufidx, 2):le_uint()', depth))
+      result.append(LINE('local subpacket_dissector = messagetable:get_dissector(submsgid)', depth))
+      result.append(LINE('if subpacket_dissector ~= nil then', depth))
+      result.append(LINE('subid_str = subpacket_dissector(buffer(bufidx, %s_count):tvb(), pinfo, tree)' % (lua_var_prefix), depth + 1))
+      result.append(LINE('else', depth))
       # if it is an unknown message, create an info entry
-      result += LINE('local %s_tree = %s_tree:add(pf_sub_messageid, buffer(bufidx, 2), submsgid, string.format("Included Message, MessageID: 0x%%04X, %%d bytes", submsgid, %s_count))' % (string_prefix, lua_var_prefix, lua_var_prefix), depth)
-      result += LINE('%s_tree:append_text(", unknown message")' % string_prefix, depth + 1)
-      result += LINE('end', depth)
-      result += LINE("bufidx = bufidx + %s_count" % (lua_var_prefix), depth)
+      result.append(LINE('local %s_tree = %s_tree:add(pf_sub_messageid, buffer(bufidx, 2), submsgid, string.format("Included Message, MessageID: 0x%%04X, %%d bytes", submsgid, %s_count))' % (string_prefix, lua_var_prefix, lua_var_prefix), depth))
+      result.append(LINE('%s_tree:append_text(", unknown message")' % string_prefix, depth + 1))
+      result.append(LINE('end', depth))
+      result.append(LINE("bufidx = bufidx + %s_count" % (lua_var_prefix), depth))
     return result
 
   def parse_count_field(self, element, lua_var_prefix, filename, depth=1):
@@ -427,11 +952,11 @@ class Parse_JSIDL:
     min_count = element.value.min_count
     max_count = element.value.max_count
     count_str = "buffer(bufidx, %d):le_uint()" % (field_type_unsigned)
-    data_str = LINE('%s_tree:add(buffer(bufidx, %d), string.format("Count: %%d, min_count: %s, max_count: %s", %s))' % (lua_var_prefix, field_type_unsigned, str(min_count), str(max_count), count_str), depth)
+    data_str = [LINE('%s_tree:add(buffer(bufidx, %d), string.format("Count: %%d, min_count: %s, max_count: %s", %s))' % (lua_var_prefix, field_type_unsigned, str(min_count), str(max_count), count_str), depth)]
     return count_str, data_str, field_type_unsigned
 
   def parse_variable_length_string(self, element, lua_var_prefix, filename, depth=1, declared_name='', declared_comment=''):
-    data_string = ""
+    data_string = []
     name = self.get_name(element, force=declared_name)
     _comment = self.get_comment(element, force=declared_comment)
     # read count field first
@@ -440,46 +965,48 @@ class Parse_JSIDL:
       raise Exception("variable_length_string should contain count_field!")
     string_prefix = "%s_%s" % (lua_var_prefix, name)
     count_str, data_string, count_type_len = self.parse_count_field(count_field, string_prefix, filename, depth)
-    result = ""
-    result += LINE('local %s_tree = %s_tree:add(buffer(bufidx, %d + %s), string.format("%s[%%d]: %%s", %s, buffer(bufidx + %d, %s):string()))' % (string_prefix, lua_var_prefix, count_type_len, count_str, name, count_str, count_type_len, count_str), depth)
+    # the count field is checked with the enclosing segment
+    result = self._length_check("%d + %s" % (count_type_len, count_str), name, depth)
+    result.append(LINE('local %s_tree = %s_tree:add(buffer(bufidx, %d + %s), string.format("%s[%%d]: %%s", %s, buffer(bufidx + %d, %s):string()))' % (string_prefix, lua_var_prefix, count_type_len, count_str, name, count_str, count_type_len, count_str), depth))
     result += data_string
-    result += LINE("bufidx = bufidx + %d + %s" % (count_type_len, count_str), depth)
+    result.append(LINE("bufidx = bufidx + %d + %s" % (count_type_len, count_str), depth))
     return result
 
   def parse_list(self, element, lua_var_prefix, filename, depth=1, declared_name='', declared_comment=''):
-    data_string = ""
+    data_string = []
     name = self.get_name(element, force=declared_name)
     comment = self.get_comment(element, force=declared_comment)
     list_prefix = "%s_%s" % (lua_var_prefix, name)
-    result = LINE("local bufidx_start_%s = bufidx" % lua_var_prefix, depth)
+    result = [LINE("local bufidx_start_%s = bufidx" % lua_var_prefix, depth)]
     # read count field first
     count_field = element.value.orderedContent()[0]
     if count_field.elementDeclaration.name().localName() != "count_field":
       raise Exception("count_field should be first element in the list!")
     count_str, data_string, count_type_len = self.parse_count_field(count_field, list_prefix, filename, depth)
     # add list elements
-    data_string += LINE("local %s_count = %s" % (list_prefix, count_str), depth)
-    data_string += LINE("bufidx = bufidx + %d" % count_type_len, depth)
-    data_string += LINE('for %s_counter=1,%s_count do' % (lua_var_prefix, list_prefix), depth)
+    data_string.append(LINE("local %s_count = %s" % (list_prefix, count_str), depth))
+    data_string.append(LINE("bufidx = bufidx + %d" % count_type_len, depth))
+    data_string.append(LINE('for %s_counter=1,%s_count do' % (lua_var_prefix, list_prefix), depth))
     for list_line in element.value.orderedContent():
       if list_line.elementDeclaration.name().localName() != "count_field":
         data_string += self.parse_element(list_line, list_prefix, filename, depth + 1, list_index_str="%s_counter - 1" % lua_var_prefix)
-    data_string += LINE('end', depth)
-    result += LINE('local %s_tree = %s_tree:add(buffer(bufidx_start_%s, buffer:len() - bufidx_start_%s), "%s %s")' % (list_prefix, lua_var_prefix, lua_var_prefix, lua_var_prefix, name, comment), depth)
+    data_string.append(LINE('end', depth))
+    result.append(LINE('local %s_tree = %s_tree:add(buffer(bufidx_start_%s, buffer:len() - bufidx_start_%s), "%s %s")' % (list_prefix, lua_var_prefix, lua_var_prefix, lua_var_prefix, name, comment), depth))
     result += data_string
     return result
 
   def parse_presence_vector(self, element, lua_var_prefix, filename, depth=1):
-    result = ""
+    result = []
     type_len = self.get_field_type_length(element.value.field_type_unsigned)
-    result += LINE('local %s_pv = buffer(bufidx, %d):le_uint()' % (lua_var_prefix, type_len), depth)
-    result += LINE('local %s_pv_count = 0' % (lua_var_prefix), depth)
-    result += LINE('%s_tree:add(buffer(bufidx, %d), string.format("%s: %%s", bitstr(buffer(bufidx, %d):le_uint(), %d * 8)))' % (lua_var_prefix, type_len, "Presence Vector", type_len, type_len), depth)
-    result += LINE("bufidx = bufidx + %d" % type_len, depth)
+    result.append(LINE('fieldbuf = buffer(%s, %d)' % (self._bufidx(), type_len), depth))
+    result.append(LINE('local %s_pv = fieldbuf:le_uint()' % (lua_var_prefix), depth))
+    result.append(LINE('local %s_pv_count = 0' % (lua_var_prefix), depth))
+    result.append(LINE('%s_tree:add(fieldbuf, string.format("%s: %%s", bitstr(%s_pv, %d * 8)))' % (lua_var_prefix, "Presence Vector", lua_var_prefix, type_len), depth))
+    self._offset += type_len
     return result
 
   def parse_fixed_field(self, element, lua_var_prefix, filename, depth=1, declared_name='', declared_comment=''):
-    result = ""
+    result = []
     name = self.get_name(element, force=declared_name)
     q_type_length = self.get_field_type_length(element.value.field_type)
     comment = self.get_comment(element, "(%s)" % element.value.field_type, force=declared_comment)
@@ -491,19 +1018,20 @@ class Parse_JSIDL:
       elif valset.elementDeclaration.name().localName() == "scale_range":
         scale_factor, bias = self.parse_scale_range(valset, q_type_length, lua_var_prefix, filename, depth)
     if lua_var_prefix == "header":
-      result += LINE('tree_msg:add(pf_messageid, buffer(bufidx, %d), messageid, string.format(\'Header, %s: 0x%%04X %s\', messageid))' % (q_type_length, name, comment), depth)
+      result.append(LINE('tree_msg:add(pf_messageid, buffer(%s, %d), messageid, string.format(\'Header, %s: 0x%%04X %s\', messageid))' % (self._bufidx(), q_type_length, name, comment), depth))
     else:
-      buffer_str = "buffer(bufidx, %d)" % (q_type_length)
+      buffer_str = "fieldbuf"
+      result.append(LINE('fieldbuf = buffer(%s, %d)' % (self._bufidx(), q_type_length), depth))
       if value_set:
         result += value_set
-        result += LINE("local value_id, value_name = (value_set[%s:le_uint()])" % (buffer_str), depth)
-        result += LINE('%s_tree:add(%s, string.format("%s: %%d [%%s] -- (%s)", %s:le_uint(), value_id))' % (lua_var_prefix, buffer_str, name, element.value.field_type, buffer_str), depth)
+        result.append(LINE("local value_id, value_name = (value_set[%s:le_uint()])" % (buffer_str), depth))
+        result.append(LINE('%s_tree:add(%s, string.format("%s: %%d [%%s] -- (%s)", %s:le_uint(), value_id))' % (lua_var_prefix, buffer_str, name, element.value.field_type, buffer_str), depth))
       elif scale_factor is not None:
         # print scaled float values
-        result += LINE('%s_tree:add(%s, string.format("%s: %%.4f (scaled) %s", %s:le_uint() * %.12f + (%.12f)))' % (lua_var_prefix, buffer_str, name, comment, buffer_str, scale_factor, bias), depth)
+        result.append(LINE('%s_tree:add(%s, string.format("%s: %%.4f (scaled) %s", %s:le_uint() * %.12f + (%.12f)))' % (lua_var_prefix, buffer_str, name, comment, buffer_str, scale_factor, bias), depth))
       else:
-        result += LINE('%s_tree:add(%s, string.format("%s: %%d %s", %s:le_uint()))' % (lua_var_prefix, buffer_str, name, comment, buffer_str), depth)
-    result += LINE("bufidx = bufidx + %d" % q_type_length, depth)
+        result.append(LINE('%s_tree:add(%s, string.format("%s: %%d %s", %s:le_uint()))' % (lua_var_prefix, buffer_str, name, comment, buffer_str), depth))
+    self._offset += q_type_length
     return result
 
   def parse_declared_array(self, element, lua_var_prefix, filename, depth=1):
@@ -531,7 +1059,7 @@ class Parse_JSIDL:
     return self.parse_variable_length_string(js, lua_var_prefix, infile, depth, element.value.name, self.get_comment(element))
 
   def parse_variable_field(self, element, lua_var_prefix, filename, depth=1, list_index_str=''):
-    result = ""
+    result = []
     name = self.get_name(element)
     comment = self.get_comment(element)
 
@@ -572,35 +1100,35 @@ class Parse_JSIDL:
         value_set_list_str = ', '.join(['[%d] = %d' % (vsl[0], vsl[1]) for vsl in value_set_list])
         scale_factor_list_str = ', '.join(['[%d] = %d' % (sfl[0], sfl[1]) for sfl in scale_factor_list])
         scale_bias_list_str = ', '.join(['[%d] = %d' % (sbl[0], sbl[1]) for sbl in scale_bias_list])
-        result += LINE("local types_set = {%s}" % types_list_str, depth)
-        result += LINE("local unit_set = {%s}" % unit_list_str, depth)
-        result += LINE("local type_value = buffer(bufidx, 1):le_uint()", depth)
-        result += LINE("local value = buffer(bufidx+1, types_list(type_value)):le_uint()", depth)
-        result += LINE("-- check for value_set or scale options", depth)
-        result += LINE("local value_set_tabe = {%s}" % value_set_list_str, depth)
-        result += LINE("local scale_set_tabe = {%s}" % scale_factor_list_str, depth)
-        result += LINE("local bias_set_tabe = {%s}" % scale_bias_list_str, depth)
-        result += LINE("local value_set = value_set_tabe(type_value)", depth)
-        result += LINE("local scale = scale_set_tabe(type_value)", depth)
-        result += LINE("local bias = bias_set_tabe(type_value)", depth)
-        result += LINE("if (value_set ~= nil) then", depth)
-        result += LINE("-- value_set: NOT implemented", depth+1)
+        result.append(LINE("local types_set = {%s}" % types_list_str, depth))
+        result.append(LINE("local unit_set = {%s}" % unit_list_str, depth))
+        result.append(LINE("local type_value = buffer(bufidx, 1):le_uint()", depth))
+        result.append(LINE("local value = buffer(bufidx+1, types_list(type_value)):le_uint()", depth))
+        result.append(LINE("-- check for value_set or scale options", depth))
+        result.append(LINE("local value_set_tabe = {%s}" % value_set_list_str, depth))
+        result.append(LINE("local scale_set_tabe = {%s}" % scale_factor_list_str, depth))
+        result.append(LINE("local bias_set_tabe = {%s}" % scale_bias_list_str, depth))
+        result.append(LINE("local value_set = value_set_tabe(type_value)", depth))
+        result.append(LINE("local scale = scale_set_tabe(type_value)", depth))
+        result.append(LINE("local bias = bias_set_tabe(type_value)", depth))
+        result.append(LINE("if (value_set ~= nil) then", depth))
+        result.append(LINE("-- value_set: NOT implemented", depth+1))
         # result += value_set
-        # result += LINE("local value_id, value_name = (value_set[%s:le_uint()])" % (buffer_str), depth)
-        # result += LINE('%s_tree:add(%s, string.format("%s: %%d [%%s] -- (%s)", %s:le_uint(), value_id))' % (lua_var_prefix, buffer_str, name, element.value.field_type, buffer_str), depth)
-        result += LINE('local %s_tree = %s_tree:add(buffer(bufidx+1, types_list(type_value)), string.format("%s: %%d %%s (VALUE_SET defined, but interpreted)", value, unit_list(type_value)))' % (name, lua_var_prefix, name), depth+1)
-        result += LINE('%s_tree:add(buffer(bufidx, 1), string.format("index: %%d", type_value))' % (name), depth+1)
-        result += LINE("elseif (scale ~= nil) then", depth)
-        result += LINE('local %s_tree = %s_tree:add(buffer(bufidx+1, types_list(type_value)), string.format("%s: %%.4f (scaled) %%s", value * scale + bias, unit_list(type_value)))' % (name, lua_var_prefix, name), depth+1)
-        result += LINE('%s_tree:add(buffer(bufidx, 1), string.format("index: %%d", type_value))' % (name), depth+1)
-        result += LINE("else", depth)
-        result += LINE('local %s_tree = %s_tree:add(buffer(bufidx+1, types_list(type_value)), string.format("%s: %%d %%s", value, unit_list(type_value)))' % (name, lua_var_prefix, name), depth+1)
-        result += LINE('%s_tree:add(buffer(bufidx, 1), string.format("index: %%d", type_value))' % (name), depth+1)
-        result += LINE("end", depth)
-        result += LINE("-- increase index for type_and_units_field", depth)
-        result += LINE("bufidx = bufidx + 1", depth)
-        result += LINE("-- increase index for contained type", depth)
-        result += LINE("bufidx = bufidx + types_list(type_value)", depth)
+        # result.append(LINE("local value_id, value_name = (value_set[%s:le_uint()])" % (buffer_str), depth))
+        # result.append(LINE('%s_tree:add(%s, string.format("%s: %%d [%%s] -- (%s)", %s:le_uint(), value_id))' % (lua_var_prefix, buffer_str, name, element.value.field_type, buffer_str), depth))
+        result.append(LINE('local %s_tree = %s_tree:add(buffer(bufidx+1, types_list(type_value)), string.format("%s: %%d %%s (VALUE_SET defined, but interpreted)", value, unit_list(type_value)))' % (name, lua_var_prefix, name), depth+1))
+        result.append(LINE('%s_tree:add(buffer(bufidx, 1), string.format("index: %%d", type_value))' % (name), depth+1))
+        result.append(LINE("elseif (scale ~= nil) then", depth))
+        result.append(LINE('local %s_tree = %s_tree:add(buffer(bufidx+1, types_list(type_value)), string.format("%s: %%.4f (scaled) %%s", value * scale + bias, unit_list(type_value)))' % (name, lua_var_prefix, name), depth+1))
+        result.append(LINE('%s_tree:add(buffer(bufidx, 1), string.format("index: %%d", type_value))' % (name), depth+1))
+        result.append(LINE("else", depth))
+        result.append(LINE('local %s_tree = %s_tree:add(buffer(bufidx+1, types_list(type_value)), string.format("%s: %%d %%s", value, unit_list(type_value)))' % (name, lua_var_prefix, name), depth+1))
+        result.append(LINE('%s_tree:add(buffer(bufidx, 1), string.format("index: %%d", type_value))' % (name), depth+1))
+        result.append(LINE("end", depth))
+        result.append(LINE("-- increase index for type_and_units_field", depth))
+        result.append(LINE("bufidx = bufidx + 1", depth))
+        result.append(LINE("-- increase index for contained type", depth))
+        result.append(LINE("bufidx = bufidx + types_list(type_value)", depth))
     return result
 
   def parse_scale_range(self, element, q_type_length, lua_var_prefix, filename, depth):
@@ -610,7 +1138,7 @@ class Parse_JSIDL:
     return scale_factor, bias
 
   def parse_value_set(self, element, depth):
-    result = ""
+    result = []
     q_list = ""
     if element.value.value_enum:
         q_list = ', '.join(['[%d] = "%s"' % (val_enum.enum_index, self.check_spaces(val_enum.enum_const)) for val_enum in element.value.value_enum])
@@ -622,21 +1150,26 @@ class Parse_JSIDL:
     #     except Exception:
     #       pass
     # rang_interpretation = '; '.join(rang_interpretation)
-    result += LINE("local value_set = {%s}" % q_list, depth)
+    result.append(LINE("local value_set = {%s}" % q_list, depth))
     return result
 
   def find_header(self, jsmsg, filename):
-      result = ""
+      result = []
+      for header, infile in self._header_elements(jsmsg, filename):
+        result = self.parse_element(header, "header", filename=infile)
+      return result
+
+  def _header_elements(self, jsmsg, filename):
+      # returns tuples of (element, file) of the header or resolved declared header
+      result = []
       for rc in jsmsg.orderedContent():
         elname = rc.elementDeclaration.name().localName()
         if elname == "header":
-          for header in jsmsg.header.orderedContent():
-            result = self.parse_element(header, "header", filename=filename)
+          result += [(header, filename) for header in jsmsg.header.orderedContent()]
         elif elname == "declared_header":
           # try to resolve header reference
-          js, filename = self._resolve_type_ref(rc.value.declared_type_ref, "header", filename=filename)
-          for header in js.value.orderedContent():
-            result = self.parse_element(header, "header", filename=filename)
+          js, infile = self._resolve_type_ref(rc.value.declared_type_ref, "header", filename=filename)
+          result += [(header, infile) for header in js.value.orderedContent()]
       return result
 
   def get_field_type_length(self, field_type):
@@ -680,89 +1213,130 @@ class Parse_JSIDL:
           declared_id = declared_ref.id
           declared_vers = declared_ref.version
           logging.debug("declared_type_set_ref: id='%s', version='%s'" % (declared_id, declared_vers))
-          ref_js = None
           # try to find file with referenced set
-          inpath = None
-          for xml_file in self._local_first_xml_files():
-            ref_js = self._get_doc(xml_file)
-            if ref_js.id == declared_id and ref_js.version == declared_vers:
-              logging.debug("found referenced type for '%s' in '%s v%s', file: %s" % (tagname, declared_id, declared_vers, xml_file))
-              inpath = xml_file
-              break
-          if ref_js is None:
+          inpath = self._find_xml_file(declared_id, declared_vers)
+          if inpath is None:
             raise Exception("Type reference not found: id='%s', version='%s'" % (declared_id, declared_vers))
-          else:
-            return self._resolve_type_ref('.'.join(path_list[1:]), tagname, inpath)
+          logging.debug("found referenced type for '%s' in '%s v%s', file: %s" % (tagname, declared_id, declared_vers, inpath))
+          return self._resolve_type_ref('.'.join(path_list[1:]), tagname, inpath)
     raise Exception("declared_type_ref '%s' not found in %s" % (declared_type_ref, filename))
 
-  def _resolve_const_ref(self, name, filename):
+  def _const_symbols(self, filename):
+    '''
+    Returns a dictionary with all constants visible in given file: the const_def's of the file
+    and the constants of referenced const sets prefixed by the reference name, e.g. 'ref.NAME'.
+    The values are tuples of (const_value, declaring file).
+    '''
+    try:
+      return self._const_tables[filename]
+    except KeyError:
+      pass
+    symbols = {}
+    # store before resolving the references to stop on circular references
+    self._const_tables[filename] = symbols
     js = self._get_doc(filename)
-    path_list = name.split(".")
-    # by one element we have the name of referenced item, search in `js` for tags with `tagname`
-    if len(path_list) == 1:
-      for tag in js.orderedContent():
-        if 'const_def' == tag.elementDeclaration.name().localName() and path_list[0] == tag.value.name:
-          return tag.value.const_value, tag.value.const_type, filename
-    else:
-      # read first all defined references
-      for declared_const_ref in js.declared_const_set_ref:
-        if path_list[0] == declared_const_ref.name:
-          declared_id = declared_const_ref.id
-          declared_vers = declared_const_ref.version
-          logging.debug("declared_const_ref: id='%s', version='%s'" % (declared_id, declared_vers))
-          ref_js = None
-          # try to find file with referenced set
-          inpath = None
-          for xml_file in self._local_first_xml_files():
-            ref_js = self._get_doc(xml_file)
-            if ref_js.id == declared_id and ref_js.version == declared_vers:
-              logging.debug("found referenced const '%s v%s' in %s" % (declared_id, declared_vers, xml_file))
-              inpath = xml_file
+    for tag in js.orderedContent():
+      if 'const_def' == tag.elementDeclaration.name().localName():
+        symbols[tag.value.name] = (tag.value.const_value, filename)
+    for declared_const_ref in getattr(js, 'declared_const_set_ref', []):
+      declared_id = declared_const_ref.id
+      declared_vers = declared_const_ref.version
+      logging.debug("declared_const_ref: id='%s', version='%s'" % (declared_id, declared_vers))
+      inpath = self._find_xml_file(declared_id, declared_vers, os.path.dirname(filename))
+      if inpath is None:
+        logging.warning("declared_const_ref not found: id='%s', version='%s', file: %s" % (declared_id, declared_vers, filename))
+        continue
+      for name, value in self._const_symbols(inpath).items():
+        symbols['%s.%s' % (declared_const_ref.name, name)] = value
+    return symbols
+
+  def _eval_const_expr(self, value, filename):
+    # evaluates an arithmetic expression with constants declared in `filename`, results are cached
+    key = (value, filename)
+    try:
+      return self._const_values[key]
+    except KeyError:
+      pass
+    symbols = self._const_symbols(filename)
+
+    def resolve(name):
+      try:
+        const_value, infile = symbols[name]
+      except KeyError:
+        raise Exception("declared_const_ref '%s' not found in %s" % (name, filename))
+      return self._eval_const_expr(const_value, infile)
+    ret = eval_arithmetic(value, resolve)
+    logging.debug("resolved '%s' in %s, evaluated to %s" % (value, filename, ret))
+    self._const_values[key] = ret
+    return ret
+
+  def _index_xml_files(self, xml_files):
+    # read only the root attributes to map (id, version) of each set to its files and the references
+    # to other sets, which precede the definitions
+    for xml_file in sorted(xml_files):
+      refs = set()
+      try:
+        with open(xml_file, 'rb') as f:
+          for idx, (_event, elem) in enumerate(ET.iterparse(f, events=('start',))):
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if idx == 0:
+              key = (elem.get('id'), elem.get('version'))
+              self._xml_file_ids.setdefault(key, []).append(xml_file)
+            elif tag in ('declared_const_set_ref', 'declared_type_set_ref'):
+              refs.add((elem.get('id'), elem.get('version')))
+            elif tag not in self.REFERENCE_SCAN_ELEMENTS:
               break
-          if ref_js is None:
-            raise Exception("declared_const_ref not found: id='%s', version='%s'" % (declared_id, declared_vers))
-          else:
-            return self._resolve_const_ref('.'.join(path_list[1:]), inpath)
-    raise Exception("declared_const_ref '%s' not found in %s" % (name, filename))
+      except (ET.ParseError, IOError, OSError) as err:
+        # invalid, or removed since the files were searched
+        logging.warning("Can not read id of %s: %s" % (xml_file, err))
+      self._xml_file_refs[xml_file] = refs
 
-  def _local_first_xml_files(self):
+  def _used_files(self, xml_file):
+    # the file and all files with sets referenced directly or indirectly by it
+    result = set([xml_file])
+    queue = [xml_file]
+    while queue:
+      for key in self._xml_file_refs.get(queue.pop(), ()):
+        for ref_file in self._xml_file_ids.get(key, []):
+          if ref_file not in result:
+            result.add(ref_file)
+            queue.append(ref_file)
+    return result
+
+  def _referenced_files(self, js):
+    # all files with type or const sets referenced in given document
+    result = set()
+    for declared_ref in list(getattr(js, 'declared_type_set_ref', [])) + list(getattr(js, 'declared_const_set_ref', [])):
+      result.update(self._xml_file_ids.get((str(declared_ref.id), str(declared_ref.version)), []))
+    return result
+
+  def _find_xml_file(self, set_id, version, dirname=None):
     # search in current directory first!
-    return [f for f in self.xml_files if f.startswith(self.dirname) ] + [f for f in self.xml_files if not f.startswith(self.dirname)]
+    if dirname is None:
+      dirname = self.dirname
+    files = self._xml_file_ids.get((str(set_id), str(version)), [])
+    for xml_file in files:
+      if xml_file.startswith(dirname):
+        return xml_file
+    if files:
+      return files[0]
+    return None
 
   def _to_float(self, value, filename):
     try:
       return float(value)
     except ValueError:
-      rval = value
-      # find variables in values
-      re_vars = re.compile(r"(?P<name>[a-zA-Z]+[^\*\-\+\/]*)")
-      for var in re_vars.findall(value):
-        # replace all known variables
-        const_val, _const_type, _filename = self._resolve_const_ref(var, filename)
-        rval = rval.replace(var, const_val)
-      # try to convert again
-      ret = float(eval(rval))
-      logging.debug("resolved '%s' to '%s', evaluated to %.6f" % (value, rval, ret))
-      return ret
+      return float(self._eval_const_expr(str(value), filename))
 
   def _to_int(self, value, filename):
     try:
       return int(value)
     except ValueError:
-      rval = value
-      # find variables in values
-      re_vars = re.compile(r"(?P<name>[a-zA-Z]+[^\*\-\+\/]*)")
-      for var in re_vars.findall(value):
-        # replace all known variables
-        const_val, _const_type, _filename = self._resolve_const_ref(var, filename)
-        rval = rval.replace(var, const_val)
-      # try to convert again
-      ret = int(eval(rval))
-      logging.debug("resolved '%s' to '%s', evaluated to %d" % (value, rval, ret))
-      return ret
+      return int(self._eval_const_expr(str(value), filename))
 
   def _get_doc(self, path):
     try:
+      self.doc_files.move_to_end(path)
       return self.doc_files[path]
     except KeyError:
       try:
@@ -775,6 +1349,9 @@ class Parse_JSIDL:
           data = f.read()
           jsdoc = jsidl.CreateFromDocument(data)
           self.doc_files[path] = jsdoc
+          # remove least recently used documents
+          while len(self.doc_files) > self.DOC_CACHE_SIZE:
+            self.doc_files.popitem(last=False)
           return jsdoc
       except Exception as e:
         import traceback
@@ -0,0 +1,451 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import collections
+import mmap
+import os
+import struct
+
+'''
+Index of the IOP packets in a pcap or pcapng file. The capture is scanned once, the IOP header of each
+packet is read at the same offsets as the Wireshark dissector does. The index is written next to the
+capture and contains the records sorted by message ID and time, so a query reads only the matching records:
+
+  with PacketIndex.open('capture.pcapng') as index:
+    for rec in index.query(0x4402, start=t1, end=t2, src=component_id('5.1.1')):
+      data = index.read_packet(rec)
+'''
+
+# ports registered by the Wireshark plugin
+IOP_UDP_PORTS = (3794, 55555)
+IOP_TCP_PORTS = (3794,)
+# message_id of middle and last packets of a multi-packet stream, they contain no message ID
+NO_MESSAGE_ID = 0x10000
+# lost packets arriving at most this count of sequence numbers late are reordered, other packets going back
+# restart the sequence analysis of the stream. Written into the plugin, used also by the live monitor
+SEQ_REORDER_WINDOW = 64
+
+# frame: packet number in the capture starting with 1, like in Wireshark
+# offset, caplen: position and length of the captured frame in the capture file
+# src, dst: component IDs as integer (subsystem << 16 | node << 8 | component)
+# data_flags: 0 single packet, 1 first, 2 middle, 3 last packet of a multi-packet stream
+IndexRecord = collections.namedtuple('IndexRecord', 'timestamp_ns frame offset caplen message_id src dst seq_nr linktype data_flags')
+
+_HEADER = struct.Struct('<8sIIIQq')
+_MAGIC = b'IOPIDX\x00\x00'
+_VERSION = 2
+# message ID, first record, count of records
+_GROUP = struct.Struct('<III')
+_RECORD = struct.Struct('<qQQIIIIHHBx')
+_TIMESTAMP = struct.Struct('<q')
+
+_PCAP_MAGIC = {0xa1b2c3d4: 1000, 0xa1b23c4d: 1}
+_PCAPNG_SHB = 0x0A0D0D0A
+_PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+
+def component_id(id_str):
+  '''
+  :param str id_str: component ID as displayed by Wireshark, e.g. '5.1.1' (subsystem.node.component)
+  :return: integer used in the index
+  '''
+  subsystem, node, component = [int(val) for val in id_str.split('.')]
+  return (subsystem << 16) | (node << 8) | component
+
+
+def component_str(cid):
+  return "%d.%d.%d" % (cid >> 16, (cid >> 8) & 0xFF, cid & 0xFF)
+
+
+def default_index_path(pcap_path):
+  return "%s.iopidx" % pcap_path
+
+
+def transport_payload(data, linktype):
+  '''
+  Returns the UDP or TCP payload of the captured frame if it is sent from or to a port of the IOP plugin,
+  otherwise None. Fragmented IP packets are ignored.
+  '''
+  offset = 0
+  ethertype = None
+  if linktype == 1:
+    # Ethernet, skip VLAN tags
+    offset = 14
+    ethertype = struct.unpack_from('>H', data, 12)[0]
+    while ethertype in (0x8100, 0x88A8) and len(data) >= offset + 4:
+      ethertype = struct.unpack_from('>H', data, offset + 2)[0]
+      offset += 4
+  elif linktype == 113:
+    # Linux cooked capture
+    offset = 16
+    ethertype = struct.unpack_from('>H', data, 14)[0]
+  elif linktype == 276:
+    # Linux cooked capture v2
+    offset = 20
+    ethertype = struct.unpack_from('>H', data, 0)[0]
+  elif linktype == 0:
+    # BSD loopback, address family in host byte order
+    offset = 4
+    family = struct.unpack_from('<I', data, 0)[0]
+    if family > 0xFFFF:
+      family = struct.unpack_from('>I', data, 0)[0]
+    ethertype = {2: 0x0800, 24: 0x86DD, 28: 0x86DD, 30: 0x86DD}.get(family)
+  elif linktype in (12, 14, 101, 228, 229):
+    # raw IP
+    ethertype = {4: 0x0800, 6: 0x86DD}.get(data[0] >> 4)
+  if ethertype == 0x0800:
+    ihl = (data[offset] & 0x0F) * 4
+    protocol = data[offset + 9]
+    flags_fragment = struct.unpack_from('>H', data, offset + 6)[0]
+    if flags_fragment & 0x3FFF:
+      # more fragments flag or fragment offset
+      return None
+    ip_end = offset + struct.unpack_from('>H', data, offset + 2)[0]
+    offset += ihl
+  elif ethertype == 0x86DD:
+    protocol = data[offset + 6]
+    ip_end = offset + 40 + struct.unpack_from('>H', data, offset + 4)[0]
+    offset += 40
+    # skip extension headers: hop-by-hop, routing, destination options
+    while protocol in (0, 43, 60):
+      protocol = data[offset]
+      offset += (data[offset + 1] + 1) * 8
+  else:
+    return None
+  if protocol == 17:
+    src_port, dst_port, udp_len = struct.unpack_from('>HHH', data, offset)
+    if src_port not in IOP_UDP_PORTS and dst_port not in IOP_UDP_PORTS:
+      return None
+    return data[offset + 8:min(offset + udp_len, len(data))]
+  elif protocol == 6:
+    src_port, dst_port = struct.unpack_from('>HH', data, offset)
+    if src_port not in IOP_TCP_PORTS and dst_port not in IOP_TCP_PORTS:
+      return None
+    data_offset = (data[offset + 12] >> 4) * 4
+    return data[offset + data_offset:min(ip_end, len(data))]
+  return None
+
+
+def iop_header(payload):
+  '''
+  Reads the IOP header like proto.dissector of the Wireshark plugin.
+  :return: tuple (message_id, src, dst, seq_nr, data_flags) or None if it is no uncompressed IOP packet
+  '''
+  length = len(payload)
+  if length < 15:
+    return None
+  if (payload[1] >> 6) & 0x03:
+    # header compression
+    return None
+  data_flags = payload[4] >> 6
+  dst, src = struct.unpack_from('<5xII', payload, 0)
+  seq_nr = struct.unpack_from('<H', payload, length - 2)[0]
+  message_id = NO_MESSAGE_ID
+  if data_flags in (0, 1) and length - 1 >= 16:
+    message_id = struct.unpack_from('<H', payload, 13)[0]
+  return message_id, src, dst, seq_nr, data_flags
+
+
+def pcap_file_header(data):
+  '''
+  Reads the global header of a pcap file (not pcapng).
+  :return: tuple (byte order for struct, factor of the timestamp fraction to nanoseconds, linktype)
+  '''
+  for endian in '<>':
+    magic = struct.unpack_from(endian + 'I', data, 0)[0]
+    if magic in _PCAP_MAGIC:
+      break
+  else:
+    raise Exception("unknown capture file format, only pcap and pcapng are supported")
+  linktype = struct.unpack_from(endian + 'I', data, 20)[0] & 0xFFFF
+  return endian, _PCAP_MAGIC[magic], linktype
+
+
+def pcap_frames(data):
+  '''
+  Yields tuples (timestamp_ns, offset, caplen, linktype) for all frames of a pcap or pcapng file.
+  '''
+  if len(data) < 24:
+    raise Exception("file too short for pcap or pcapng")
+  block_type = struct.unpack_from('<I', data, 0)[0]
+  if block_type == _PCAPNG_SHB:
+    for frame in _pcapng_frames(data):
+      yield frame
+    return
+  endian, ns_factor, linktype = pcap_file_header(data)
+  record = struct.Struct(endian + 'IIII')
+  offset = 24
+  end = len(data)
+  while offset + 16 <= end:
+    ts_sec, ts_frac, caplen, _origlen = record.unpack_from(data, offset)
+    offset += 16
+    if offset + caplen > end:
+      # truncated file
+      break
+    yield ts_sec * 1000000000 + ts_frac * ns_factor, offset, caplen, linktype
+    offset += caplen
+
+
+def _pcapng_frames(data):
+  endian = '<'
+  interfaces = []
+  offset = 0
+  end = len(data)
+  while offset + 12 <= end:
+    block_type, block_len = struct.unpack_from(endian + 'II', data, offset)
+    if block_type == _PCAPNG_SHB:
+      # new section, the byte order may change
+      magic = struct.unpack_from('<I', data, offset + 8)[0]
+      endian = '<' if magic == _PCAPNG_BYTE_ORDER_MAGIC else '>'
+      block_len = struct.unpack_from(endian + 'I', data, offset + 4)[0]
+      interfaces = []
+    if block_len < 12 or offset + block_len > end:
+      # truncated file
+      break
+    if block_type == 1:
+      # interface description block
+      linktype = struct.unpack_from(endian + 'H', data, offset + 8)[0]
+      interfaces.append((linktype, _pcapng_tsresol(data, offset + 16, offset + block_len - 4, endian)))
+    elif block_type == 6:
+      # enhanced packet block
+      if_id, ts_high, ts_low, caplen = struct.unpack_from(endian + 'IIII', data, offset + 8)
+      if if_id >= len(interfaces):
+        offset += block_len
+        continue
+      linktype, tsresol = interfaces[if_id]
+      timestamp = (ts_high << 32) | ts_low
+      if tsresol & 0x80:
+        timestamp_ns = (timestamp * 1000000000) >> (tsresol & 0x7F)
+      elif tsresol <= 9:
+        timestamp_ns = timestamp * 10 ** (9 - tsresol)
+      else:
+        timestamp_ns = timestamp // 10 ** (tsresol - 9)
+      yield timestamp_ns, offset + 28, caplen, linktype
+    elif block_type == 3 and interfaces:
+      # simple packet block, without timestamp and always for the first interface
+      caplen = min(struct.unpack_from(endian + 'I', data, offset + 8)[0], block_len - 16)
+      yield 0, offset + 12, caplen, interfaces[0][0]
+    offset += block_len
+
+
+def _pcapng_tsresol(data, offset, end, endian):
+  # returns the value of the if_tsresol option, default is 6 (microseconds)
+  while offset + 4 <= end:
+    code, length = struct.unpack_from(endian + 'HH', data, offset)
+    if code == 0:
+      break
+    if code == 9 and length == 1:
+      return data[offset + 4]
+    offset += 4 + ((length + 3) & ~3)
+  return 6
+
+
+def build_index(pcap_path, index_path=None):
+  '''
+  Scans the capture and writes the index, an existing index will be replaced at once.
+  :return: tuple (count of IOP packets, count of all frames)
+  '''
+  if index_path is None:
+    index_path = default_index_path(pcap_path)
+  # message ID: packed records, the records are kept packed to limit the memory used by large captures
+  groups = {}
+  # message ID: timestamp of the last record
+  last_timestamps = {}
+  unsorted = set()
+  frames = 0
+  stat = os.stat(pcap_path)
+  with open(pcap_path, 'rb') as f:
+    if stat.st_size == 0:
+      raise Exception("empty capture file: %s" % pcap_path)
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      for timestamp_ns, offset, caplen, linktype in pcap_frames(data):
+        frames += 1
+        try:
+          payload = transport_payload(data[offset:offset + caplen], linktype)
+          header = None if payload is None else iop_header(payload)
+        except (IndexError, struct.error):
+          # truncated frame
+          continue
+        if header is not None:
+          message_id, src, dst, seq_nr, data_flags = header
+          groups.setdefault(message_id, bytearray()).extend(_RECORD.pack(timestamp_ns, frames, offset, caplen, message_id, src, dst, seq_nr, linktype, data_flags))
+          if timestamp_ns < last_timestamps.get(message_id, timestamp_ns):
+            unsorted.add(message_id)
+          last_timestamps[message_id] = timestamp_ns
+    finally:
+      data.close()
+  tmp_path = "%s.tmp" % index_path
+  count = 0
+  with open(tmp_path, 'wb') as f:
+    f.write(_HEADER.pack(_MAGIC, _VERSION, len(groups), sum([len(recs) // _RECORD.size for recs in groups.values()]), stat.st_size, stat.st_mtime_ns))
+    for message_id in sorted(groups):
+      f.write(_GROUP.pack(message_id, count, len(groups[message_id]) // _RECORD.size))
+      count += len(groups[message_id]) // _RECORD.size
+    for message_id in sorted(groups):
+      recs = groups.pop(message_id)
+      # captures are usually in time order, sort only if not
+      if message_id in unsorted:
+        recs = b''.join([_RECORD.pack(*rec) for rec in sorted(_RECORD.iter_unpack(recs))])
+      f.write(recs)
+  os.replace(tmp_path, index_path)
+  return count, frames
+
+
+class PacketIndex(object):
+  '''
+  Read access to an index written by build_index(). The records are read from a memory map on demand.
+  '''
+
+  def __init__(self, pcap_path, index_path=None):
+    self.pcap_path = pcap_path
+    self.index_path = index_path or default_index_path(pcap_path)
+    self._file = open(self.index_path, 'rb')
+    try:
+      self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      self._file.close()
+      raise Exception("invalid packet index: %s" % self.index_path)
+    magic, version, group_count, self.record_count, self.pcap_size, self.pcap_mtime_ns = _HEADER.unpack_from(self._data, 0)
+    if magic != _MAGIC or version != _VERSION:
+      self.close()
+      raise Exception("invalid packet index or version: %s" % self.index_path)
+    # message ID: (first record, count)
+    self._groups = collections.OrderedDict()
+    for idx in range(group_count):
+      message_id, first, count = _GROUP.unpack_from(self._data, _HEADER.size + idx * _GROUP.size)
+      self._groups[message_id] = (first, count)
+    self._records_offset = _HEADER.size + group_count * _GROUP.size
+    self._pcap = None
+
+  @classmethod
+  def open(cls, pcap_path, index_path=None, rebuild=False):
+    '''
+    Opens the index of the capture, it is created if it does not exist or the capture has changed.
+    '''
+    index_path = index_path or default_index_path(pcap_path)
+    if not rebuild and os.path.isfile(index_path):
+      try:
+        index = cls(pcap_path, index_path)
+      except Exception:
+        # index of an older version
+        index = None
+      if index is not None:
+        if index.is_current():
+          return index
+        index.close()
+    build_index(pcap_path, index_path)
+    return cls(pcap_path, index_path)
+
+  def is_current(self):
+    '''
+    :return: False if the capture was changed after the index was created
+    '''
+    stat = os.stat(self.pcap_path)
+    return stat.st_size == self.pcap_size and stat.st_mtime_ns == self.pcap_mtime_ns
+
+  def close(self):
+    self._data.close()
+    self._file.close()
+    if self._pcap is not None:
+      self._pcap.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def message_ids(self):
+    '''
+    :return: dictionary with message ID and count of packets, NO_MESSAGE_ID for packets without message ID
+    '''
+    return dict([(message_id, count) for message_id, (_first, count) in self._groups.items()])
+
+  def _record(self, idx):
+    return IndexRecord(*_RECORD.unpack_from(self._data, self._records_offset + idx * _RECORD.size))
+
+  def _timestamp(self, idx):
+    return _TIMESTAMP.unpack_from(self._data, self._records_offset + idx * _RECORD.size)[0]
+
+  def _bisect(self, lo, hi, timestamp_ns):
+    # index of the first record in [lo, hi) with timestamp >= timestamp_ns
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self._timestamp(mid) < timestamp_ns:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  def query(self, message_ids=None, start=None, end=None, src=None, dst=None):
+    '''
+    Returns the matching records sorted by frame number.
+    :param message_ids: message ID or list of IDs, all if None
+    :param float start: first timestamp in seconds since epoch (inclusive)
+    :param float end: last timestamp in seconds since epoch (exclusive)
+    :param int src: source component ID, see component_id()
+    :param int dst: destination component ID
+    '''
+    if message_ids is None:
+      message_ids = list(self._groups.keys())
+    elif isinstance(message_ids, int):
+      message_ids = [message_ids]
+    start_ns = None if start is None else int(start * 1000000000)
+    end_ns = None if end is None else int(end * 1000000000)
+    result = []
+    for message_id in message_ids:
+      if message_id not in self._groups:
+        continue
+      first, count = self._groups[message_id]
+      lo = first if start_ns is None else self._bisect(first, first + count, start_ns)
+      hi = first + count if end_ns is None else self._bisect(lo, first + count, end_ns)
+      for idx in range(lo, hi):
+        rec = self._record(idx)
+        if (src is None or rec.src == src) and (dst is None or rec.dst == dst):
+          result.append(rec)
+    result.sort(key=lambda rec: rec.frame)
+    return result
+
+  def read_packet(self, record):
+    '''
+    :return: the captured frame of the record, read from the capture file
+    '''
+    if self._pcap is None:
+      self._pcap = open(self.pcap_path, 'rb')
+    self._pcap.seek(record.offset)
+    return self._pcap.read(record.caplen)
+
+  def extract(self, records, path):
+    '''
+    Writes the frames of the records into a new pcap file.
+    '''
+    linktypes = set([rec.linktype for rec in records])
+    if len(linktypes) > 1:
+      raise Exception("records with different link types %s can not be written to one pcap file" % sorted(linktypes))
+    with open(path, 'wb') as f:
+      # nanosecond resolution
+      f.write(struct.pack('<IHHiIII', 0xa1b23c4d, 2, 4, 0, 0, 262144, linktypes.pop() if linktypes else 1))
+      for rec in records:
+        data = self.read_packet(rec)
+        f.write(struct.pack('<IIII', rec.timestamp_ns // 1000000000, rec.timestamp_ns % 1000000000, len(data), len(data)))
+        f.write(data)
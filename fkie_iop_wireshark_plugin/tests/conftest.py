@@ -0,0 +1,108 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import os
+import sys
+
+import pytest
+
+'''
+Run the tests from the package directory with `python3 -m pytest tests`. Tests of the generator need
+PyXB-X and the generated bindings, tests of the Lua code need lupa, otherwise they are skipped.
+'''
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PACKAGE_PATH, 'src'))
+
+CONST_SET = '''<?xml version="1.0" encoding="UTF-8"?>
+<declared_const_set xmlns="urn:jaus:jsidl:1.1" name="TestConsts" id="urn:test:consts" version="1.0">
+  <const_def name="MAX_POINTS" const_type="unsigned integer" const_value="4" field_units="one"/>
+  <const_def name="POSE_MAX" const_type="long float" const_value="100.5" field_units="meter"/>
+</declared_const_set>
+'''
+
+TYPE_SET = '''<?xml version="1.0" encoding="UTF-8"?>
+<declared_type_set xmlns="urn:jaus:jsidl:1.1" name="TestTypes" id="urn:test:types" version="1.0">
+  <declared_const_set_ref name="c" id="urn:test:consts" version="1.0"/>
+  <fixed_field name="SpeedRec" field_type="unsigned short integer" field_units="meter" optional="false">
+    <scale_range real_lower_limit="-c.POSE_MAX" real_upper_limit="c.POSE_MAX * 2" integer_function="round"/>
+  </fixed_field>
+  <bit_field name="Flags" field_type_unsigned="unsigned byte" optional="false">
+    <sub_field name="A"><bit_range from_index="0" to_index="1"/><value_set offset_to_lower_limit="false"><value_enum enum_index="0" enum_const="x"/></value_set></sub_field>
+  </bit_field>
+</declared_type_set>
+'''
+
+MESSAGE_SET = '''<?xml version="1.0" encoding="UTF-8"?>
+<declared_type_set xmlns="urn:jaus:jsidl:1.1" name="TestMsgs" id="urn:test:msgs" version="1.0">
+  <declared_const_set_ref name="c" id="urn:test:consts" version="1.0"/>
+  <declared_type_set_ref name="t" id="urn:test:types" version="1.0"/>
+  <message_def name="ReportThing" message_id="4402" is_command="false">
+    <description>Report</description>
+    <header name="AppHeader"><record name="HeaderRec" optional="false">
+      <fixed_field name="MessageID" optional="false" field_type="unsigned short integer" field_units="one"/>
+    </record></header>
+    <body name="Body"><record name="Rec" optional="false">
+      <presence_vector field_type_unsigned="unsigned byte"/>
+      <fixed_field name="X" field_type="integer" field_units="meter" optional="false"/>
+      <fixed_field name="Y" field_type="unsigned byte" field_units="one" optional="true"/>
+      <declared_fixed_field name="Speed" declared_type_ref="t.SpeedRec" optional="false"/>
+      <declared_bit_field name="F" declared_type_ref="t.Flags" optional="false"/>
+      <array name="Pts" optional="false">
+        <fixed_field name="P" field_type="unsigned short integer" field_units="one" optional="false"/>
+        <dimension name="d1" size="c.MAX_POINTS"/>
+      </array>
+      <variable_length_string name="Name" optional="false"><count_field field_type_unsigned="unsigned byte"/></variable_length_string>
+    </record></body>
+    <footer name="Footer"/>
+  </message_def>
+  <message_def name="QueryThing" message_id="2402" is_command="false">
+    <description>Query</description>
+    <header name="AppHeader"><record name="HeaderRec" optional="false">
+      <fixed_field name="MessageID" optional="false" field_type="unsigned short integer" field_units="one"/>
+    </record></header>
+    <body name="Body"><list name="L" optional="false"><count_field field_type_unsigned="unsigned byte"/>
+      <record name="Item" optional="false"><fixed_field name="V" field_type="unsigned byte" field_units="one" optional="false"/></record>
+    </list></body>
+    <footer name="Footer"/>
+  </message_def>
+</declared_type_set>
+'''
+
+
+@pytest.fixture
+def jsidl_path(tmp_path):
+  '''
+  Directory with a const set, a type set and a set with messages using both. Skips the test if
+  PyXB-X or the generated bindings are not installed.
+  '''
+  pytest.importorskip('pyxb')
+  try:
+    import jsidl_pyxb.jsidl  # noqa: F401
+  except ImportError:
+    pytest.importorskip('fkie_iop_wireshark_plugin.jsidl_pyxb.jsidl')
+  path = tmp_path / 'jsidl'
+  path.mkdir()
+  for filename, content in [('consts.xml', CONST_SET), ('types.xml', TYPE_SET), ('msgs.xml', MESSAGE_SET)]:
+    (path / filename).write_text(content)
+  return str(path)
@@ -0,0 +1,74 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import pytest
+
+from fkie_iop_wireshark_plugin.parse_jsidl import eval_arithmetic
+
+CONSTANTS = {'MAX': 10, 'ref.MAX_VALUE': 100, 'a.b.LIMIT': 2.5}
+
+
+def resolve(name):
+  return CONSTANTS[name]
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('42', 42),
+    (' 1.5 ', 1.5),
+    ('-MAX', -10),
+    ('ref.MAX_VALUE * 2 + 1', 201),
+    ('(MAX + 2) // 5', 2),
+    ('MAX / 4', 2.5),
+    ('MAX % 3', 1),
+    ('2 ** 8 - 1', 255),
+    ('a.b.LIMIT * -2', -5.0),
+])
+def test_eval(expression, expected):
+  assert eval_arithmetic(expression, resolve) == expected
+
+
+@pytest.mark.parametrize('expression', [
+    '__import__("os").system("true")',
+    'MAX if MAX else 0',
+    '[MAX]',
+    'MAX < 1',
+    'True',
+    "'text'",
+    '2 ** 1000',
+    'MAX +',
+    '',
+])
+def test_rejected(expression):
+  with pytest.raises(ValueError):
+    eval_arithmetic(expression, resolve)
+
+
+def test_resolve_gets_dotted_names():
+  # attributes are never evaluated, e.g. 'MAX.__class__' is resolved as constant name
+  names = []
+
+  def collect(name):
+    names.append(name)
+    return 1
+  eval_arithmetic('a + b.c * d.e.f', collect)
+  assert names == ['a', 'b.c', 'd.e.f']
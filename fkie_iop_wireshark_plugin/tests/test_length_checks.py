@@ -0,0 +1,86 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import os
+import struct
+import sys
+
+import pytest
+
+from conftest import PACKAGE_PATH
+from fkie_iop_wireshark_plugin.parse_jsidl import Parse_JSIDL
+
+lupa = pytest.importorskip('lupa.lua52')
+sys.path.insert(0, os.path.join(PACKAGE_PATH, 'benchmarks'))
+from dissector_benchmark import iop_packet, load_plugin  # noqa: E402
+
+'''
+Length checks of the generated message dissectors, run with the Wireshark mock of the dissector benchmark.
+'''
+
+# ReportThing: message ID, presence vector, X, Y, Speed, F, Pts[4], Name with count
+REPORT_THING = struct.pack('<HBiBHB4H', 0x4402, 0xff, -5, 1, 100, 1, 1, 2, 3, 4) + b'\x03abc'
+REPORT_THING_MIN_SIZE = 2 + 1 + 4 + 2 + 1 + 4 * 2 + 1
+
+
+@pytest.fixture
+def dissect(jsidl_path, tmp_path):
+  '''
+  Returns a function, which dissects a payload with the generated plugin and returns the lines of
+  the message tree, a Lua error is added as last line.
+  '''
+  lua_path = str(tmp_path / 'fkie_iop.lua')
+  Parse_JSIDL(jsidl_path, lua_path)
+  runtime = load_plugin(lua_path)
+  lua = runtime.globals()
+
+  def _dissect(payload):
+    _info, log = lua.dissect_logged(lua.mktvb(runtime.table_from(list(bytearray(iop_packet(payload, 1))))), 1)
+    lines = log.split('\n')
+    return lines[[line.startswith('iop.message_name') for line in lines].index(True):]
+  return _dissect
+
+
+def test_complete_message(dissect):
+  lines = dissect(REPORT_THING)
+  assert not [line for line in lines if line.strip().startswith('!') or line.startswith('error')]
+  assert lines[-1].strip() == '@19:1 | Count: 3, min_count: None, max_count: None'
+
+
+def test_truncated_message(dissect):
+  for length in range(2, len(REPORT_THING)):
+    lines = dissect(REPORT_THING[:length])
+    assert not [line for line in lines if line.startswith('error')], length
+    assert lines[-1].strip().startswith('!Truncated message'), length
+    # the message length check is advisory only
+    assert ('!Message shorter than its minimal size of %d bytes' % REPORT_THING_MIN_SIZE in [line.strip() for line in lines]) == (length < REPORT_THING_MIN_SIZE)
+
+
+def test_fields_before_truncation(dissect):
+  lines = [line.strip() for line in dissect(REPORT_THING[:9])]
+  assert '@3:4 | X: 4294967291' in lines
+  assert lines[-1] == '!Truncated message: 12 bytes expected for Speed..Name, 1 left'
+  # list with count 3 and one item
+  lines = dissect(struct.pack('<HBB', 0x2402, 3, 7))
+  assert not [line for line in lines if line.startswith('error')]
+  assert lines[-1].strip().startswith('!Truncated message')
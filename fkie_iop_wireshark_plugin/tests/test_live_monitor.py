@@ -0,0 +1,154 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import random
+import re
+import struct
+
+import pytest
+
+from fkie_iop_wireshark_plugin.live_monitor import LiveMonitor, PayloadDecoder, RollingRate, StreamStats, build_layout
+from fkie_iop_wireshark_plugin.message_catalog import CatalogField
+from fkie_iop_wireshark_plugin.pcap_index import SEQ_REORDER_WINDOW, component_id
+
+TIMEOUT = 60
+
+
+def stream_counts(seq_numbers, timestamps=None):
+  stream = StreamStats(1, 2)
+  for idx, seq_nr in enumerate(seq_numbers):
+    stream.update(seq_nr, idx if timestamps is None else timestamps[idx], TIMEOUT)
+  return stream.received, stream.lost, stream.duplicate, stream.reordered
+
+
+def test_stream_stats():
+  assert stream_counts([65534, 65535, 0, 0, 3]) == (5, 2, 1, 0)
+  # late packets are taken out of the lost count
+  assert stream_counts([1, 2, 5, 3, 6]) == (5, 1, 0, 1)
+  assert stream_counts([1, 4, 3, 2]) == (4, 0, 0, 2)
+  # only the last SEQ_REORDER_WINDOW lost packets are remembered
+  assert stream_counts([0, SEQ_REORDER_WINDOW + 2, 1]) == (3, SEQ_REORDER_WINDOW + 1, 0, 0)
+  # going back to a number not lost restarts the stream, e.g. after a reboot of the component
+  assert stream_counts([1000, 1001, 1001, 999, 1000]) == (5, 0, 1, 0)
+  assert stream_counts([1000, 10, 11]) == (3, 0, 0, 0)
+  # a stream without packets for the timeout starts again
+  assert stream_counts([1000, 2000], [0, TIMEOUT + 1]) == (2, 0, 0, 0)
+
+
+def random_sequence(rnd, count):
+  '''
+  Sequence numbers with lost, duplicated and late packets and restarts, wrapping at 16 bit.
+  '''
+  seq_nr = 65500
+  lost = []
+  result = []
+  for _ in range(count):
+    value = rnd.random()
+    if value < 0.1:
+      skip = rnd.randint(1, 5)
+      lost += [(seq_nr + idx) % 65536 for idx in range(1, skip + 1)]
+      seq_nr = (seq_nr + skip + 1) % 65536
+      result.append(seq_nr)
+    elif value < 0.15 and lost:
+      result.append(lost.pop(rnd.randrange(len(lost))))
+    elif value < 0.2:
+      result.append(seq_nr)
+    elif value < 0.22:
+      seq_nr = rnd.randrange(65536)
+      lost = []
+      result.append(seq_nr)
+    else:
+      seq_nr = (seq_nr + 1) % 65536
+      result.append(seq_nr)
+  return result
+
+
+def test_stream_stats_like_plugin():
+  pytest.importorskip('lupa.lua52')
+  from test_seq_analysis import dissect, load_template
+  rnd = random.Random(1)
+  for _ in range(5):
+    seq_numbers = random_sequence(rnd, 500)
+    runtime = load_template()
+    dissect(runtime, seq_numbers, False)
+    # the lost counts of the plugin are final after the first pass
+    markers = [re.search(r'\[(.*)\]', info) for info in dissect(runtime, seq_numbers, True)]
+    markers = [marker.group(1) for marker in markers if marker is not None]
+    lost = sum([int(marker.split()[0]) for marker in markers if marker.endswith(' lost')])
+    assert stream_counts(seq_numbers) == (len(seq_numbers), lost, markers.count('duplicate'), markers.count('reordered'))
+
+
+def test_rolling_rate():
+  rate = RollingRate(window=2)
+  for timestamp in (10.1, 10.5, 11.2, 12.9):
+    rate.add(timestamp, 100)
+  # the current second is not complete and not counted
+  assert rate.rate(12.9) == (1.5, 150.0)
+  assert rate.rate(20.0) == (0.0, 0.0)
+  assert (rate.total, rate.last_timestamp) == (4, 12.9)
+
+
+def test_decode():
+  fields = [CatalogField('Body', 'body', None, None, False, None, None),
+            CatalogField('Body.Rec', 'record', None, None, False, None, None),
+            CatalogField('Body.Rec', 'presence_vector', 'unsigned byte', 1, False, None, None),
+            CatalogField('Body.Rec.X', 'fixed_field', 'integer', 4, False, None, None),
+            CatalogField('Body.Rec.Y', 'fixed_field', 'unsigned byte', 1, True, None, None),
+            CatalogField('Body.Rec.Speed', 'fixed_field', 'unsigned short integer', 2, True, 0.5, -10.0),
+            CatalogField('Body.Rec.Name', 'fixed_length_string', None, 4, False, None, None),
+            CatalogField('Body.L', 'list', None, None, False, None, None),
+            CatalogField('Body.L', 'count_field', 'unsigned byte', 1, False, None, None),
+            CatalogField('Body.L.V', 'fixed_field', 'unsigned short integer', 2, False, None, None)]
+
+  class Catalog(object):
+    def fields(self, message_id):
+      return fields if message_id == 0x4402 else []
+  decoder = PayloadDecoder(Catalog())
+  assert len(build_layout(fields).children) == 1
+  # Y is not present
+  data = struct.pack('<BiH4sBHH', 0x02, -5, 40, b'ab\x00\x00', 2, 7, 8)
+  assert decoder.decode(0x4402, data) == ([('Body.Rec.X', -5), ('Body.Rec.Speed', 10.0), ('Body.Rec.Name', 'ab'), ('Body.L[0].V', 7), ('Body.L[1].V', 8)], True)
+  assert decoder.decode(0x4402, data[:-1]) == ([('Body.Rec.X', -5), ('Body.Rec.Speed', 10.0), ('Body.Rec.Name', 'ab'), ('Body.L[0].V', 7)], False)
+  assert decoder.decode(0x2402, data) is None
+
+
+def iop_payload(src, dst, seq_nr, message_id=0x4402):
+  return struct.pack('<BBHBIIH', 2, 0, 17, 0, dst, src, message_id) + struct.pack('<H', seq_nr)
+
+
+def test_monitor_removes_idle_entries():
+  monitor = LiveMonitor(window=2, stream_timeout=TIMEOUT)
+  src1 = component_id('5.1.1')
+  src2 = component_id('150.64.1')
+  dst = component_id('150.64.2')
+  monitor.packet_received(iop_payload(src1, dst, 1), 0.0)
+  monitor.packet_received(iop_payload(src1, dst, 3), 1.0)
+  monitor.packet_received(b'\x00' * 4, 1.0)
+  monitor.packet_received(iop_payload(src2, dst, 1, 0x2402), 30.0)
+  assert (monitor.received, monitor.invalid) == (3, 1)
+  assert monitor.streams[(src1, dst)].lost == 1
+  assert sorted(monitor.components) == [src1, src2]
+  monitor.packet_received(iop_payload(src2, dst, 2, 0x2402), TIMEOUT + 1.5)
+  assert list(monitor.components) == [src2]
+  assert list(monitor.messages) == [(src2, 0x2402)]
+  assert list(monitor.streams) == [(src2, dst)]
@@ -0,0 +1,70 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import os
+
+import pytest
+
+from fkie_iop_wireshark_plugin.message_catalog import CatalogField, CatalogMessage, MessageCatalog, write_catalog
+from fkie_iop_wireshark_plugin.parse_jsidl import Parse_JSIDL
+
+
+def test_write_and_read(tmp_path):
+  path = str(tmp_path / 'sub' / 'messages.db')
+  report = CatalogMessage(0x4402, 'ReportThing', 'msgs.xml', 'TestMsgs', 'urn:test:msgs', '1.0')
+  query = CatalogMessage(0x2402, 'QueryThing', 'msgs.xml', 'TestMsgs', 'urn:test:msgs', '1.0')
+  fields = [CatalogField('Body.Rec.X', 'fixed_field', 'integer', 4, False, None, None),
+            CatalogField('Body.Rec.Speed', 'fixed_field', 'unsigned short integer', 2, True, 0.5, -10.0)]
+  write_catalog(path, [(report, fields), (query, [])])
+  # an existing catalog is replaced
+  write_catalog(path, [(report, fields), (query, [])])
+  with MessageCatalog(path) as catalog:
+    assert catalog.messages() == [query, report]
+    assert catalog.message(0x4402) == report
+    assert catalog.message(0x1234) is None
+    assert catalog.messages_by_name('QueryThing') == [query]
+    assert catalog.fields(0x4402) == fields
+    assert catalog.fields(0x2402) == []
+  assert not os.path.exists(path + '.tmp')
+
+
+def test_missing_catalog(tmp_path):
+  with pytest.raises(IOError):
+    MessageCatalog(str(tmp_path / 'messages.db'))
+
+
+def test_generated_catalog(jsidl_path, tmp_path):
+  path = str(tmp_path / 'messages.db')
+  Parse_JSIDL(jsidl_path, str(tmp_path / 'fkie_iop.lua'), [], path)
+  with MessageCatalog(path) as catalog:
+    msg = catalog.message(0x4402)
+    assert msg == CatalogMessage(0x4402, 'ReportThing', os.path.join(jsidl_path, 'msgs.xml'), 'TestMsgs', 'urn:test:msgs', '1.0')
+    fields = dict([((field.path, field.kind), field) for field in catalog.fields(0x4402)])
+    assert fields[('Body.Rec.X', 'fixed_field')].size == 4
+    assert fields[('Body.Rec.Y', 'fixed_field')].optional
+    # declared type of another set with scaling by constants of a third set
+    speed = fields[('Body.Rec.Speed', 'fixed_field')]
+    assert (speed.field_type, speed.size, speed.scale_bias) == ('unsigned short integer', 2, -100.5)
+    assert speed.scale_factor == pytest.approx((100.5 * 2 + 100.5) / 65535)
+    assert fields[('Body.Rec.Pts.d1', 'dimension')].size == 4
+    assert [field.path for field in catalog.fields(0x2402) if field.kind == 'count_field'] == ['Body.L']
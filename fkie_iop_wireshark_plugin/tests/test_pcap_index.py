@@ -0,0 +1,146 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import importlib.util
+import os
+import struct
+import time
+
+import pytest
+
+from conftest import PACKAGE_PATH
+from fkie_iop_wireshark_plugin import pcap_index
+from fkie_iop_wireshark_plugin.pcap_index import NO_MESSAGE_ID, IndexRecord, PacketIndex, build_index, component_id
+
+START = 1700000000
+
+
+def iop_payload(message_id, src, dst, seq_nr, data_flags=0):
+  payload = struct.pack('<H6s', message_id, b'\x00' * 6) if data_flags in (0, 1) else b'\x00' * 8
+  return struct.pack('<BBHBII', 2, 0, 15 + len(payload), data_flags << 6, dst, src) + payload + struct.pack('<H', seq_nr)
+
+
+def ethernet_udp(payload, src_port=3794, dst_port=3794):
+  udp = struct.pack('>HHHH', src_port, dst_port, 8 + len(payload), 0) + payload
+  ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0, b'\x0a\x00\x00\x01', b'\x0a\x00\x00\x02') + udp
+  return b'\xff' * 6 + b'\x00' * 6 + b'\x08\x00' + ip
+
+
+def write_pcap(path, frames):
+  # frames: list of (timestamp in ns, data), written with nanosecond resolution
+  with open(path, 'wb') as f:
+    f.write(struct.pack('<IHHiIII', 0xa1b23c4d, 2, 4, 0, 0, 65535, 1))
+    for timestamp_ns, data in frames:
+      f.write(struct.pack('<IIII', timestamp_ns // 1000000000, timestamp_ns % 1000000000, len(data), len(data)) + data)
+
+
+def write_pcapng(path, frames):
+  # frames: list of (timestamp in ns, data), the interface has a resolution of 1 ns
+  def block(block_type, body):
+    body += b'\x00' * ((4 - len(body) % 4) % 4)
+    return struct.pack('<II', block_type, 12 + len(body)) + body + struct.pack('<I', 12 + len(body))
+  with open(path, 'wb') as f:
+    f.write(block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1)))
+    f.write(block(1, struct.pack('<HHI', 1, 0, 65535) + struct.pack('<HHB3x', 9, 1, 9) + struct.pack('<HH', 0, 0)))
+    for timestamp_ns, data in frames:
+      f.write(block(6, struct.pack('<IIIII', 0, timestamp_ns >> 32, timestamp_ns & 0xFFFFFFFF, len(data), len(data)) + data))
+
+
+@pytest.fixture
+def frames():
+  '''
+  20 frames in steps of 0.1 s with ReportThing (0x4402) in odd and QueryThing (0x2402) in even frames.
+  '''
+  dst = component_id('150.64.2')
+  result = []
+  for idx in range(20):
+    src = component_id('5.1.1') if idx % 4 < 2 else component_id('150.64.1')
+    result.append((START * 1000000000 + idx * 100000000, ethernet_udp(iop_payload(0x4402 if idx % 2 else 0x2402, src, dst, idx))))
+  # other ports, middle packet of a multi-packet stream and a packet earlier than all other ReportThing
+  result[3] = (result[3][0], ethernet_udp(iop_payload(0x4402, component_id('5.1.1'), dst, 3), 1234, 5678))
+  result[5] = (result[5][0], ethernet_udp(iop_payload(0, component_id('5.1.1'), dst, 5, data_flags=2)))
+  result[7] = (result[0][0], result[7][1])
+  return result
+
+
+@pytest.mark.parametrize('writer', [write_pcap, write_pcapng])
+def test_query(tmp_path, frames, writer):
+  path = str(tmp_path / 'capture')
+  writer(path, frames)
+  assert build_index(path) == (19, 20)
+  with PacketIndex.open(path) as index:
+    assert index.message_ids() == {0x2402: 10, 0x4402: 8, NO_MESSAGE_ID: 1}
+    assert [rec.frame for rec in index.query(0x4402)] == [2, 8, 10, 12, 14, 16, 18, 20]
+    assert [rec.frame for rec in index.query(0x4402, src=component_id('5.1.1'))] == [2, 10, 14, 18]
+    # the records are sorted by time, the start is inclusive, the end exclusive
+    assert [rec.frame for rec in index.query(0x4402, start=START, end=START + 0.1)] == [8]
+    assert [rec.frame for rec in index.query(0x4402, start=START + 1.25, end=START + 1.65)] == [14, 16]
+    assert [rec.frame for rec in index.query([0x2402, 0x4402], end=START + 0.15)] == [1, 2, 8]
+    rec = index.query(0x4402)[0]
+    assert rec == IndexRecord(START * 1000000000 + 100000000, 2, rec.offset, len(frames[1][1]), 0x4402, component_id('5.1.1'), component_id('150.64.2'), 1, 1, 0)
+    assert index.read_packet(rec) == frames[1][1]
+    extracted = str(tmp_path / 'extracted.pcap')
+    index.extract(index.query(0x4402), extracted)
+  assert build_index(extracted) == (8, 8)
+
+
+def test_changed_capture(tmp_path, frames):
+  path = str(tmp_path / 'capture.pcap')
+  write_pcap(path, frames[:10])
+  with PacketIndex.open(path) as index:
+    assert sum(index.message_ids().values()) == 9
+  write_pcap(path, frames)
+  os.utime(path, ns=(0, START * 1000000000))
+  with PacketIndex(path) as index:
+    assert not index.is_current()
+  with PacketIndex.open(path) as index:
+    assert index.is_current()
+    assert sum(index.message_ids().values()) == 19
+
+
+def test_record_packing():
+  # captures larger than 4 GiB need 64-bit offsets
+  rec = IndexRecord(START * 1000000000 + 999999999, 2 ** 33, 5 * 2 ** 32 + 7, 70000, NO_MESSAGE_ID, component_id('65535.255.255'), 1, 65535, 276, 3)
+  assert IndexRecord(*pcap_index._RECORD.unpack(pcap_index._RECORD.pack(*rec))) == rec
+
+
+@pytest.fixture
+def parse_time(monkeypatch):
+  if not hasattr(time, 'tzset'):
+    pytest.skip('time zones can not be changed on this platform')
+  spec = importlib.util.spec_from_file_location('iop_pcap_index', os.path.join(PACKAGE_PATH, 'scripts', 'iop_pcap_index.py'))
+  script = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(script)
+  monkeypatch.setenv('TZ', 'Europe/Berlin')
+  time.tzset()
+  yield script.parse_time
+  monkeypatch.undo()
+  time.tzset()
+
+
+def test_parse_time(parse_time):
+  assert parse_time('1700000000.5') == 1700000000.5
+  # local time with the UTC offset valid at that date
+  assert parse_time('2024-07-01 12:00:00') == 1719828000
+  assert parse_time('2024-01-15 12:00:00') == 1705316400
+  assert parse_time('2024-07-01T12:00:00+00:00') == 1719835200
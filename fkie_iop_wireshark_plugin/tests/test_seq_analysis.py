@@ -0,0 +1,87 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import os
+import re
+import sys
+
+import pytest
+
+from conftest import PACKAGE_PATH
+from fkie_iop_wireshark_plugin.pcap_index import SEQ_REORDER_WINDOW
+
+lupa = pytest.importorskip('lupa.lua52')
+sys.path.insert(0, os.path.join(PACKAGE_PATH, 'benchmarks'))
+from dissector_benchmark import WIRESHARK_MOCK, iop_packet  # noqa: E402
+
+'''
+Sequence number analysis of the Lua template, run with the Wireshark mock of the dissector benchmark.
+'''
+
+
+def load_template():
+  runtime = lupa.LuaRuntime()
+  runtime.execute(WIRESHARK_MOCK)
+  with open(os.path.join(PACKAGE_PATH, 'src', 'fkie_iop_wireshark_plugin', 'fkie_iop_template.lua')) as f:
+    runtime.execute(f.read())
+  # written by the generator after the template
+  runtime.execute('seq_reorder_window = %d' % SEQ_REORDER_WINDOW)
+  return runtime
+
+
+def dissect(runtime, seq_numbers, visited):
+  '''
+  :return: list with the sequence part of the info column of each packet, e.g. 'SeqNr: 5 [2 lost]'
+  '''
+  lua = runtime.globals()
+  result = []
+  for number, seq_nr in enumerate(seq_numbers, 1):
+    tvb = lua.mktvb(runtime.table_from(list(bytearray(iop_packet(b'\x02\x44', seq_nr)))))
+    pinfo = lua.mkpinfo(number, visited)
+    lua.protos['IOP'].dissector(tvb, pinfo, lua.mkitem(0))
+    result.append(re.search(r'SeqNr: \d+( \[[^\]]*\])?', pinfo.cols.info.v).group(0))
+  return result
+
+
+def test_lost_duplicate_and_wrap():
+  runtime = load_template()
+  assert dissect(runtime, [65534, 65535, 0, 0, 3], False) == ['SeqNr: 65534', 'SeqNr: 65535', 'SeqNr: 0', 'SeqNr: 0 [duplicate]', 'SeqNr: 3 [2 lost]']
+
+
+def test_late_packet_is_no_longer_lost():
+  runtime = load_template()
+  seq_numbers = [1, 2, 5, 3, 6]
+  assert dissect(runtime, seq_numbers, False) == ['SeqNr: 1', 'SeqNr: 2', 'SeqNr: 5 [2 lost]', 'SeqNr: 3 [reordered]', 'SeqNr: 6']
+  # the loss is corrected in the following passes, e.g. after the capture was read completely
+  assert dissect(runtime, seq_numbers, True) == ['SeqNr: 1', 'SeqNr: 2', 'SeqNr: 5 [1 lost]', 'SeqNr: 3 [reordered]', 'SeqNr: 6']
+  runtime = load_template()
+  seq_numbers = [1, 3, 2, 4]
+  dissect(runtime, seq_numbers, False)
+  assert dissect(runtime, seq_numbers, True) == ['SeqNr: 1', 'SeqNr: 3', 'SeqNr: 2 [reordered]', 'SeqNr: 4']
+
+
+def test_restart():
+  runtime = load_template()
+  # going back more than the reorder window, or to a number that was not lost, restarts the stream
+  start = 1000 + SEQ_REORDER_WINDOW + 1
+  assert dissect(runtime, [start, 1000, 1001, 1001, 999, 1000], False) == ['SeqNr: %d' % start, 'SeqNr: 1000', 'SeqNr: 1001', 'SeqNr: 1001 [duplicate]', 'SeqNr: 999', 'SeqNr: 1000']
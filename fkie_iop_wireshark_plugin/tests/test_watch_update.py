@@ -0,0 +1,113 @@
+# ****************************************************************************
+#
+# fkie_iop_wireshark_plugin
+# Copyright 2019 Fraunhofer FKIE
+# Author: Lukas Boes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ****************************************************************************
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import os
+
+import pytest
+
+from conftest import MESSAGE_SET, TYPE_SET
+from fkie_iop_wireshark_plugin.message_catalog import MessageCatalog
+from fkie_iop_wireshark_plugin.parse_jsidl import Parse_JSIDL
+
+'''
+Parse_JSIDL.update() used by --watch has to write the same plugin and catalog as a full run.
+'''
+
+# message set with other set ID and message names, but the same message IDs
+DUPLICATE_SET = MESSAGE_SET.replace('name="TestMsgs" id="urn:test:msgs"', 'name="Dup" id="urn:test:dup"').replace('ReportThing', 'ReportOther')
+
+
+def read_output(lua_path, catalog_path):
+  with open(lua_path) as f:
+    lua = f.read()
+  catalog = MessageCatalog(catalog_path)
+  try:
+    return lua, [(msg, catalog.fields(msg.message_id)) for msg in catalog.messages()]
+  finally:
+    catalog.close()
+
+
+@pytest.fixture
+def generator(jsidl_path, tmp_path):
+  '''
+  Returns a function, which calls update() of a resident Parse_JSIDL with the given changed files
+  and returns its result and output together with the output of a full run, if `full` is True.
+  '''
+  paths = dict([(name, str(tmp_path / name)) for name in ('update.lua', 'update.db', 'full.lua', 'full.db')])
+  resident = Parse_JSIDL(jsidl_path, paths['update.lua'], [], paths['update.db'])
+
+  def update(*filenames, **kwargs):
+    result = resident.update(set([os.path.join(jsidl_path, filename) for filename in filenames]))
+    full_output = None
+    if kwargs.get('full', True):
+      Parse_JSIDL(jsidl_path, paths['full.lua'], [], paths['full.db'])
+      full_output = read_output(paths['full.lua'], paths['full.db'])
+    return result, read_output(paths['update.lua'], paths['update.db']), full_output
+  return update
+
+
+def write(jsidl_path, filename, content):
+  with open(os.path.join(jsidl_path, filename), 'w') as f:
+    f.write(content)
+
+
+def test_duplicate_message_ids(jsidl_path, generator):
+  # the first file in sorted order defines the message, also if it is added later
+  write(jsidl_path, 'aa_dup.xml', DUPLICATE_SET)
+  result, updated, full = generator('aa_dup.xml')
+  assert updated == full
+  assert 'ReportOther' in updated[0] and 'ReportThing' not in updated[0]
+  os.remove(os.path.join(jsidl_path, 'aa_dup.xml'))
+  result, updated, full = generator('aa_dup.xml')
+  assert updated == full
+  assert 'ReportThing' in updated[0]
+  write(jsidl_path, 'zz_dup.xml', DUPLICATE_SET)
+  result, updated, full = generator('zz_dup.xml')
+  assert updated == full
+  assert 'ReportOther' not in updated[0]
+
+
+def test_changed_files(jsidl_path, generator):
+  write(jsidl_path, 'msgs.xml', MESSAGE_SET.replace('message_id="4402"', 'message_id="4412"'))
+  result, updated, full = generator('msgs.xml')
+  assert updated == full
+  assert 'messagetable:add(0x4412' in updated[0]
+  # files using a changed type set are parsed again
+  write(jsidl_path, 'types.xml', TYPE_SET.replace('unsigned short integer', 'unsigned integer'))
+  result, updated, full = generator('types.xml')
+  assert updated == full
+  assert os.path.join(jsidl_path, 'msgs.xml') in result
+
+
+def test_parse_error_keeps_plugin(jsidl_path, generator, tmp_path):
+  with open(str(tmp_path / 'update.lua')) as f:
+    plugin = f.read()
+  # e.g. a file read while it is saved
+  write(jsidl_path, 'types.xml', TYPE_SET[:len(TYPE_SET) // 2])
+  result, updated, _full = generator('types.xml', full=False)
+  assert result is None
+  assert updated[0] == plugin
+  write(jsidl_path, 'types.xml', TYPE_SET)
+  result, updated, full = generator('types.xml')
+  assert result is not None
+  assert updated == full